@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import time
+
+from logger import logger
+
+from .start_context import invalidate_start_context
+from .utm_index import attribute_sources
+
+
+ATTRIBUTION_BATCH_SIZE = 500
+ATTRIBUTION_FLUSH_INTERVAL = 2.0
+ATTRIBUTION_DEAD_LETTER_FILE = os.path.join("logs", "attribution_dead_letter.jsonl")
+
+
+class AttributionBuffer:
+    """
+    Отложенная запись UTM-атрибуции: события копятся в памяти и сбрасываются в БД
+    одним многострочным upsert при достижении batch_size или раз в flush_interval.
+    Для одного пользователя сохраняется первое событие (first touch). Батчи, которые
+    не удалось записать, дописываются в dead-letter файл и возвращаются в буфер после
+    следующей успешной записи.
+
+    Реферальные ссылки сюда не идут: handle_referral_link (handlers.refferal) получает
+    message и state, может ответить пользователю по ходу /start и пишет в БД сам, вне
+    этого пакета. Отложить без изменения поведения можно только UTM-атрибуцию.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = ATTRIBUTION_BATCH_SIZE,
+        flush_interval: float = ATTRIBUTION_FLUSH_INTERVAL,
+        dead_letter_file: str = ATTRIBUTION_DEAD_LETTER_FILE,
+        session_factory=None,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dead_letter_file = dead_letter_file
+        self._session_factory = session_factory
+        self._pending: dict[int, dict] = {}
+        self._task: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._flush_lock: asyncio.Lock | None = None
+        self._closing = False
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            from database import async_session_maker
+
+            self._session_factory = async_session_maker
+        return self._session_factory
+
+    def _ensure_started(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="attribution_buffer")
+
+    def add(self, user_data: dict, source_code: str):
+        tg_id = user_data["tg_id"]
+        if tg_id in self._pending:
+            return
+        self._pending[tg_id] = {**user_data, "source_code": source_code}
+        self._ensure_started()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        if self._flush_lock is None:
+            return
+        # Dead-letter перечитывается не чаще раза за сброс и только если все записи прошли
+        can_replay = True
+        async with self._flush_lock:
+            while self._pending:
+                tg_ids = list(self._pending)[: self.batch_size]
+                rows = [self._pending.pop(tg_id) for tg_id in tg_ids]
+                try:
+                    async with self._get_session_factory()() as session:
+                        await attribute_sources(session, rows)
+                except asyncio.CancelledError:
+                    # Батч уже снят с буфера: возвращаем его, чтобы он не потерялся при отмене
+                    for row in rows:
+                        self._pending.setdefault(row["tg_id"], row)
+                    raise
+                except Exception as e:
+                    logger.error(f"[Attribution] Не удалось записать {len(rows)} событий: {e}")
+                    await asyncio.to_thread(self._write_dead_letter, rows)
+                    can_replay = False
+                    continue
+                for tg_id in tg_ids:
+                    await invalidate_start_context(tg_id)
+                # БД снова доступна — возвращаем в буфер ранее отложенные события
+                if can_replay:
+                    can_replay = False
+                    await self.replay_dead_letter()
+
+    def _write_dead_letter(self, rows: list[dict]):
+        try:
+            os.makedirs(os.path.dirname(self.dead_letter_file) or ".", exist_ok=True)
+            with open(self.dead_letter_file, "a", encoding="utf-8") as f:
+                failed_at = int(time.time())
+                for row in rows:
+                    f.write(json.dumps({"failed_at": failed_at, "row": row}, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.critical(f"[Attribution] События потеряны, dead-letter недоступен: {e} ({rows})")
+
+    def _read_dead_letter(self) -> list[dict]:
+        if not os.path.exists(self.dead_letter_file):
+            return []
+        replay_path = f"{self.dead_letter_file}.replay"
+        os.replace(self.dead_letter_file, replay_path)
+        rows = []
+        with open(replay_path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)["row"]
+                    row["tg_id"], row["source_code"]
+                except (ValueError, KeyError, TypeError) as e:
+                    # Например, строка, оборванная при падении процесса во время записи
+                    logger.error(f"[Attribution] Пропущена поврежденная строка {number} dead-letter: {e!r}: {line.strip()[:200]}")
+                    continue
+                rows.append(row)
+        os.remove(replay_path)
+        return rows
+
+    async def replay_dead_letter(self) -> int:
+        """Возвращает события из dead-letter файла в буфер. Возвращает количество событий."""
+        try:
+            rows = await asyncio.to_thread(self._read_dead_letter)
+        except (OSError, ValueError) as e:
+            logger.error(f"[Attribution] Не удалось прочитать dead-letter {self.dead_letter_file}: {e}")
+            return 0
+        for row in rows:
+            source_code = row.pop("source_code")
+            self.add(row, source_code)
+        if rows:
+            logger.info(f"[Attribution] Из dead-letter возвращено {len(rows)} событий")
+        return len(rows)
+
+    async def close(self):
+        """Останавливает фоновый сброс, дождавшись текущего батча, и записывает остаток буфера."""
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+attribution_buffer = AttributionBuffer()
@@ -0,0 +1,119 @@
+"""
+Фаззинг и бенчмарк разбора deep-link команды /start.
+
+Запуск: python -m handlers.benchmarks.deep_links_bench [--iterations N] [--seed S]
+"""
+
+import argparse
+import random
+import string
+import timeit
+
+from handlers.deep_links import (
+    BUILTIN_PREFIXES,
+    CouponToken,
+    GiftToken,
+    HookToken,
+    ReferralToken,
+    UnknownToken,
+    UtmToken,
+    parse_start_payload,
+    parse_token,
+)
+
+
+SAMPLE_PAYLOADS = (
+    "referral_123456789",
+    "utm_vk_autumn-referral_987654321",
+    "coupons_SALE2024-utm_tg_channel",
+    "gift_3f2c9a7e-referral_1",
+    "utm_giftcard_promo",
+    "unknown_part-utm_ads",
+)
+
+
+def legacy_classify(payload: str) -> list[tuple[str | None, str]]:
+    """Прежняя классификация подстрокой — для сравнения скорости."""
+    result = []
+    for part in payload.split("-"):
+        if "coupons" in part:
+            result.append(("coupons", part.split("coupons")[1].strip("_")))
+            continue
+        if "gift" in part:
+            result.append(("gift", part.split("gift")[1].strip("_")))
+            break
+        if "referral" in part:
+            result.append(("referral", part.split("referral")[1].strip("_")))
+            continue
+        if "utm" in part:
+            result.append(("utm", part))
+            continue
+        result.append((None, part))
+    return result
+
+
+def _random_part(rng: random.Random) -> str:
+    alphabet = string.ascii_letters + string.digits + "_"
+    body = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 24)))
+    if rng.random() < 0.6:
+        prefix = rng.choice(BUILTIN_PREFIXES)
+        return prefix + rng.choice(("", "_", "__")) + body
+    if rng.random() < 0.3:
+        # Префикс внутри значения не должен менять тип токена
+        return body + rng.choice(BUILTIN_PREFIXES) + body
+    return body
+
+
+def fuzz(iterations: int, seed: int):
+    rng = random.Random(seed)
+    token_types = {
+        "coupons": CouponToken,
+        "gift": GiftToken,
+        "referral": ReferralToken,
+        "utm": UtmToken,
+    }
+    for _ in range(iterations):
+        parts = [_random_part(rng) for _ in range(rng.randint(1, 5))]
+        payload = "-".join(parts)
+        tokens = parse_start_payload(payload)
+
+        assert tokens == parse_start_payload(payload), payload
+        assert [token.raw for token in tokens] == parts[: len(tokens)], payload
+        assert all(not isinstance(token, GiftToken) for token in tokens[:-1]), payload
+        if not any(isinstance(token, GiftToken) for token in tokens):
+            assert len(tokens) == len(parts), payload
+
+        for token in tokens:
+            expected = next((cls for prefix, cls in token_types.items() if token.raw.startswith(prefix)), UnknownToken)
+            assert isinstance(token, expected) and not isinstance(token, HookToken), (payload, token)
+            if isinstance(token, ReferralToken) and token.referrer_id is not None:
+                assert str(token.referrer_id) == token.raw[len("referral") :].strip("_"), token
+
+    print(f"fuzz: {iterations} payloads OK (seed={seed})")
+
+
+def bench(number: int):
+    for payload in SAMPLE_PAYLOADS:
+        legacy = timeit.timeit(lambda: legacy_classify(payload), number=number)
+        parsed = timeit.timeit(lambda: parse_start_payload(payload), number=number)
+        print(
+            f"{payload[:40]:<40} legacy {legacy / number * 1e6:7.2f} мкс   "
+            f"parser {parsed / number * 1e6:7.2f} мкс"
+        )
+    single = timeit.timeit(lambda: parse_token("utm_vk_autumn"), number=number)
+    print(f"parse_token: {single / number * 1e6:.2f} мкс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--number", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fuzz(args.iterations, args.seed)
+    bench(args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Профиль импорта при холодном старте: запускает отдельный интерпретатор с -X importtime,
+импортирует модули бота и печатает самые тяжелые импорты по суммарному и собственному
+времени, а также общее время. С --preload дополнительно догружает отложенные объекты
+(handlers.lazy_modules) и показывает, сколько стоила каждая отложенная загрузка.
+
+Запуск: python -m handlers.benchmarks.import_profile [--module handlers.start ...] [--top N] [--preload]
+        [--save profile.json]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+from dataclasses import asdict, dataclass
+
+
+@dataclass(slots=True)
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+_PRELOAD_SNIPPET = """
+import json, sys
+from handlers.lazy_modules import _lazy_objects, load_times
+for obj in _lazy_objects:
+    obj.resolve()
+print(json.dumps(load_times), file=sys.stderr)
+"""
+
+
+def parse_importtime(stderr: str) -> tuple[list[ImportRecord], dict[str, float]]:
+    records = []
+    lazy_times = {}
+    for line in stderr.splitlines():
+        if line.startswith("{"):
+            lazy_times = json.loads(line)
+            continue
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # Вложенность показана отступом имени модуля: три пробела на верхнем уровне, далее по два
+        depth = (len(name) - len(name.lstrip()) - 3) // 2
+        records.append(ImportRecord(name.strip(), int(self_us), int(cumulative_us), depth))
+    return records, lazy_times
+
+
+def profile(modules: list[str], preload: bool) -> tuple[list[ImportRecord], dict[str, float]]:
+    code = "".join(f"import {module}\n" for module in modules)
+    if preload:
+        # Отложенные импорты тоже попадут в вывод importtime, их стоимость отдельно — в load_times
+        code += _PRELOAD_SNIPPET
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    records, lazy_times = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        # Traceback идет в тот же stderr после строк importtime
+        tail = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        raise SystemExit("\n".join(tail[-20:]))
+    return records, lazy_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", nargs="+", default=["handlers.start"])
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--preload", action="store_true", help="догрузить отложенные объекты после импорта")
+    parser.add_argument("--save", help="сохранить профиль в JSON")
+    args = parser.parse_args()
+
+    records, lazy_times = profile(args.module, args.preload)
+    total_us = sum(record.cumulative_us for record in records if record.depth == 0)
+    print(f"Модулей импортировано: {len(records)}, общее время: {total_us / 1000:.1f} мс\n")
+
+    print(f"{'суммарно мс':>12} {'свое мс':>9}  модуль")
+    for record in sorted(records, key=lambda r: r.cumulative_us, reverse=True)[:args.top]:
+        print(f"{record.cumulative_us / 1000:>12.1f} {record.self_us / 1000:>9.1f}  {record.module}")
+
+    print(f"\n{'свое мс':>9}  модуль")
+    for record in sorted(records, key=lambda r: r.self_us, reverse=True)[:args.top]:
+        print(f"{record.self_us / 1000:>9.1f}  {record.module}")
+
+    if lazy_times:
+        print(f"\n{'мс':>9}  отложенный модуль")
+        for module, seconds in sorted(lazy_times.items(), key=lambda item: item[1], reverse=True):
+            print(f"{seconds * 1000:>9.1f}  {module}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"imports": [asdict(record) for record in records], "lazy": lazy_times}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+"""
+Нагрузочный прогон роутеров start, happ_tv и legal_docs на синтетических апдейтах.
+
+Апдейты подаются через Dispatcher.feed_update, БД — SQLite в памяти (aiosqlite),
+Bot API и check.happ.su заменены локальным aiohttp-сервером. Для каждого сценария
+печатаются пропускная способность, p50/p99 задержки, число вызовов Bot API и
+память на апдейт (tracemalloc, отдельный последовательный проход).
+
+Задержка считается на итерацию сценария (действие пользователя, 1–2 апдейта), пропускная
+способность и память — на апдейт. Лимиты планировщика отправок по умолчанию сняты,
+--rate-limit включает боевые значения.
+
+Запуск: python -m handlers.benchmarks.load_harness [--scenario start utm ...] [--iterations N] [--concurrency C]
+        [--save results.json] [--compare baseline.json --tolerance 0.2]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+from collections import Counter
+from collections.abc import Callable
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+from aiohttp import web
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from database import add_user
+from database.models import Base, Key, TrackingSource
+from handlers.attribution_buffer import attribution_buffer
+from handlers.captcha_pool import known_users
+from handlers.fsm_storage import TTLMemoryStorage
+from handlers.happ_tv.client import happ_tv_client
+from handlers.happ_tv.router import router as happ_tv_router
+from handlers.legal_docs.router import router as legal_docs_router
+from handlers.membership import channel_membership
+from handlers.metrics import install_metrics
+from handlers.send_scheduler import SendScheduler, send_scheduler
+from handlers.start import router as start_router
+
+
+BOT_TOKEN = "123456789:AAbenchmarkbenchmarkbenchmarkbench00"
+BOT_ID = 123456789
+UTM_CODE = "utm_bench"
+BENCH_KEY = "benchkey"
+FIRST_USER_ID = 1_000_000
+KNOWN_USERS = 1_000
+
+
+class FakeTelegramServer:
+    """Минимальный Bot API и check.happ.su: отвечает валидными объектами без задержек."""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.tv_requests = 0
+        self._message_ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    def _message(self, payload: dict) -> dict:
+        chat_id = payload.get("chat_id", 0)
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0, "type": "private"},
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": "bench"},
+            "text": payload.get("text") or payload.get("caption") or "",
+        }
+
+    async def _bot_api(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        payload = dict(await request.post()) if request.body_exists else {}
+        lowered = method.lower()
+        if lowered == "getme":
+            result = {"id": BOT_ID, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif lowered == "getchatmember":
+            user_id = int(payload.get("user_id", 0))
+            result = {"status": "member", "user": {"id": user_id, "is_bot": False, "first_name": "user"}}
+        elif lowered.startswith(("send", "edit", "copy", "forward")):
+            result = self._message(payload)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _send_tv(self, request: web.Request) -> web.Response:
+        self.tv_requests += 1
+        return web.json_response({"result": "ok"})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._bot_api)
+        app.router.add_post("/sendtv/{code}", self._send_tv)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class BenchContextMiddleware(BaseMiddleware):
+    """Подставляет сессию БД и признак администратора, как это делают middleware бота."""
+
+    def __init__(self, session_maker):
+        self.session_maker = session_maker
+
+    async def __call__(self, handler, event, data):
+        async with self.session_maker() as session:
+            data["session"] = session
+            data["admin"] = False
+            return await handler(event, data)
+
+
+# --- синтетические апдейты ---
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"u{user_id}", "language_code": "ru"}
+
+
+def message_update(user_id: int, text: str) -> Update:
+    return Update.model_validate(
+        {
+            "update_id": next(_update_ids),
+            "message": {
+                "message_id": next(_update_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": _user(user_id),
+                "text": text,
+            },
+        }
+    )
+
+
+def callback_update(user_id: int, data: str) -> Update:
+    return Update.model_validate(
+        {
+            "update_id": next(_update_ids),
+            "callback_query": {
+                "id": str(next(_update_ids)),
+                "from": _user(user_id),
+                "chat_instance": "bench",
+                "data": data,
+                "message": {
+                    "message_id": 1,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": BOT_ID, "is_bot": True, "first_name": "bench"},
+                    "text": "menu",
+                },
+            },
+        }
+    )
+
+
+Scenario = Callable[[int], list[Update]]
+
+SCENARIOS: dict[str, Scenario] = {
+    "start": lambda user_id: [message_update(user_id, "/start")],
+    "utm": lambda user_id: [message_update(user_id, f"/start {UTM_CODE}")],
+    "gift": lambda user_id: [message_update(user_id, f"/start gift_bench{user_id % 10}")],
+    "about_vpn": lambda user_id: [callback_update(user_id, "about_vpn"), callback_update(user_id, "start")],
+    "legal_docs": lambda user_id: [callback_update(user_id, "legal_docs_menu")],
+    "happ_tv": lambda user_id: [callback_update(user_id, f"happ_tv|{BENCH_KEY}"), message_update(user_id, "AB123")],
+}
+
+
+# --- окружение ---
+
+
+async def setup_database(known: int):
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with session_maker() as session:
+        # Сообщения в callback'ах приходят от бота, и обработчики регистрируют его как пользователя.
+        # add_user не идемпотентен: при параллельных итерациях первая регистрация бота падала бы
+        # на IntegrityError, поэтому бот заводится заранее, один раз
+        await add_user(
+            session=session,
+            tg_id=BOT_ID,
+            username="bench_bot",
+            first_name="bench",
+            last_name=None,
+            language_code=None,
+            is_bot=True,
+        )
+        for user_id in range(FIRST_USER_ID, FIRST_USER_ID + known):
+            user = _user(user_id)
+            await add_user(
+                session=session,
+                tg_id=user_id,
+                username=user["username"],
+                first_name=user["first_name"],
+                last_name=None,
+                language_code=user["language_code"],
+                is_bot=False,
+            )
+        columns = Key.__table__.c
+        key_values = {
+            "client_id": "bench-client",
+            "tg_id": FIRST_USER_ID,
+            "email": BENCH_KEY,
+            "key": "https://example.com/sub/bench",
+            "expiry_time": int(time.time() * 1000) + 30 * 86_400_000,
+        }
+        session.add(Key(**{name: value for name, value in key_values.items() if name in columns}))
+        source_columns = TrackingSource.__table__.c
+        source_values = {"code": UTM_CODE, "name": "bench", "type": "utm", "created_by": FIRST_USER_ID}
+        session.add(TrackingSource(**{name: value for name, value in source_values.items() if name in source_columns}))
+        await session.commit()
+    return engine, session_maker
+
+
+def build_dispatcher(session_maker) -> Dispatcher:
+    dp = Dispatcher(storage=TTLMemoryStorage())
+    dp.update.outer_middleware(BenchContextMiddleware(session_maker))
+    dp.include_routers(start_router, happ_tv_router, legal_docs_router)
+    return dp
+
+
+# --- прогон ---
+
+
+async def run_iteration(dp: Dispatcher, bot: Bot, scenario: Scenario, user_id: int) -> tuple[float, int]:
+    updates = scenario(user_id)
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return time.perf_counter() - started, len(updates)
+
+
+async def run_scenario(
+    name: str, dp: Dispatcher, bot: Bot, server: FakeTelegramServer, iterations: int, concurrency: int, alloc_samples: int
+) -> dict:
+    scenario = SCENARIOS[name]
+    user_ids = itertools.cycle(range(FIRST_USER_ID, FIRST_USER_ID + max(KNOWN_USERS, 1)))
+    semaphore = asyncio.Semaphore(concurrency)
+    calls_before = sum(server.calls.values())
+
+    async def limited(user_id: int) -> tuple[float, int]:
+        async with semaphore:
+            return await run_iteration(dp, bot, scenario, user_id)
+
+    started = time.perf_counter()
+    runs = await asyncio.gather(*(limited(next(user_ids)) for _ in range(iterations)))
+    wall = time.perf_counter() - started
+    updates = sum(count for _, count in runs)
+    api_calls = sum(server.calls.values()) - calls_before
+
+    peaks, retained = [], []
+    if alloc_samples:
+        tracemalloc.start()
+        for _ in range(alloc_samples):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            _, count = await run_iteration(dp, bot, scenario, next(user_ids))
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append((peak - before) / count)
+            retained.append((current - before) / count)
+        tracemalloc.stop()
+
+    latencies = sorted(elapsed for elapsed, _ in runs)
+    return {
+        "scenario": name,
+        "iterations": iterations,
+        "updates": updates,
+        "throughput": updates / wall,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+        "api_calls_per_update": api_calls / updates,
+        "alloc_peak_kb": statistics.mean(peaks) / 1024 if peaks else 0.0,
+        "alloc_retained_b": statistics.mean(retained) if retained else 0.0,
+    }
+
+
+def compare(results: list[dict], baseline_path: str, tolerance: float) -> bool:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {row["scenario"]: row for row in json.load(f)}
+    ok = True
+    for row in results:
+        base = baseline.get(row["scenario"])
+        if base is None:
+            continue
+        if row["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            print(f"РЕГРЕССИЯ {row['scenario']}: p99 {base['p99_ms']:.2f} -> {row['p99_ms']:.2f} мс")
+            ok = False
+        if row["throughput"] < base["throughput"] * (1 - tolerance):
+            print(f"РЕГРЕССИЯ {row['scenario']}: throughput {base['throughput']:.0f} -> {row['throughput']:.0f}/с")
+            ok = False
+    return ok
+
+
+async def run(args) -> list[dict]:
+    server = FakeTelegramServer()
+    await server.start()
+    engine, session_maker = await setup_database(KNOWN_USERS)
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(server.base_url, is_local=True))
+    bot = Bot(BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+    # Глобальные компоненты бота привязаны к боевому экземпляру Bot и БД — переключаем на тестовые
+    if args.rate_limit:
+        send_scheduler.install(bot)
+    else:
+        SendScheduler(global_rate=1e9, chat_rate=1e9, chat_burst=1_000_000).install(bot)
+    install_metrics(bot)
+    channel_membership.bot = bot
+    happ_tv_client.base_url = server.base_url
+    attribution_buffer._session_factory = session_maker
+    known_users._session_factory = session_maker
+
+    dp = build_dispatcher(session_maker)
+    await dp.emit_startup(bot=bot)
+    results = []
+    try:
+        for name in args.scenario:
+            # Прогрев: кэши, ленивые импорты, пул соединений
+            await run_scenario(name, dp, bot, server, min(args.iterations, 50), args.concurrency, 0)
+            results.append(
+                await run_scenario(name, dp, bot, server, args.iterations, args.concurrency, args.alloc_samples)
+            )
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        await server.close()
+        await engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=1_000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--alloc-samples", type=int, default=100)
+    parser.add_argument("--rate-limit", action="store_true", help="боевые лимиты планировщика отправок")
+    parser.add_argument("--save", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", help="сравнить с сохраненными результатами")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    print(f"{'сценарий':<12} {'upd/s':>9} {'p50 мс':>9} {'p99 мс':>9} {'API/upd':>8} {'пик КБ':>8} {'удерж. Б':>9}")
+    for row in results:
+        print(
+            f"{row['scenario']:<12} {row['throughput']:>9.0f} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+            f"{row['api_calls_per_update']:>8.1f} {row['alloc_peak_kb']:>8.1f} {row['alloc_retained_b']:>9.0f}"
+        )
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
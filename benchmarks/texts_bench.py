@@ -0,0 +1,187 @@
+"""
+Сравнение шаблонов handlers.texts с прежними реализациями (f-строки и конкатенация).
+Проверяет, что результат совпадает символ в символ, и печатает время на вызов.
+
+Запуск: python -m handlers.benchmarks.texts_bench [--number N]
+"""
+
+import argparse
+import timeit
+
+from config import CHANNEL_EXISTS, CHANNEL_URL
+from handlers.texts import (
+    INSTRUCTIONS_TRIAL,
+    get_about_vpn,
+    get_renewal_message,
+    key_message,
+    key_message_success,
+    profile_message_send,
+)
+
+
+# Прежние реализации — эталон для сравнения
+
+def legacy_profile_message_send(username, tg_id, balance, key_count):
+    if CHANNEL_EXISTS:
+        profile_message = (
+            f"👤 <b>Профиль: {username}</b>\n\n"
+            f"<blockquote>"
+            f"•🆔 <b>ID:</b> <code>{tg_id}</code>\n"
+            f"•💰 <b>Баланс:</b> {balance} RUB\n"
+            f"•🔑 <b>Количество подписок:</b> {key_count}\n"
+            f"</blockquote>\n"
+            f"<i><b>🔒 Ознакомьтесь с <a href='https://bib-net.ru/terms.html'>Пользовательским соглашением</a> и <a href='https://bib-net.ru/privacy.html'>Политикой конфиденциальности</a>.</b></i>\n\n"
+            f"👉 <a href='{CHANNEL_URL}'>Наш канал</a> 👈"
+        )
+    else:
+        profile_message = (
+            f"👤 <b>Профиль: {username}</b>\n\n"
+            f"<blockquote>"
+            f"•🆔 <b>ID:</b> <code>{tg_id}</code>\n"
+            f"•💰 <b>Баланс:</b> {balance} RUB\n"
+            f"•🔑 <b>Количество подписок:</b> {key_count}\n"
+            f"</blockquote>\n\n"
+            f"<i><b>🔒 Ознакомьтесь с <a href='https://bib-net.ru/terms.html'>Пользовательским соглашением</a> и <a href='https://bib-net.ru/privacy.html'>Политикой конфиденциальности</a>.</b></i>\n\n"
+        )
+    return profile_message
+
+
+def legacy_key_message_success(connection_link, tariff_name: str = "", traffic_limit: int = 0, device_limit: int = 0, subgroup_title: str = ""):
+    key_message = (
+        "✅ Подписка успешно создана: 🎉\n\n"
+        f"<code>{connection_link}</code>\n\n"
+    )
+    tariff_lines = []
+    if subgroup_title and subgroup_title.strip():
+        tariff_lines.append(f"📁 Группа: {subgroup_title}")
+    if tariff_name:
+        tariff_lines.append(f"🕒 Тариф: {tariff_name}")
+    if traffic_limit is not None and traffic_limit > 0:
+        tariff_lines.append(f"📊 Трафик: {traffic_limit} ГБ")
+    if device_limit is not None and device_limit > 0:
+        tariff_lines.append(f"📱 Лимит устройств: {device_limit}")
+    if tariff_lines:
+        key_message += "📦 Информация о тарифе:" + "<blockquote>" + "\n".join(tariff_lines) + "\n</blockquote>\n"
+    key_message += "<i>Добавьте подписку в приложение — это просто:</i>\n\n"
+    key_message += f"{INSTRUCTIONS_TRIAL}"
+    return key_message
+
+
+def legacy_key_message(key, formatted_expiry_date, days_left_message, server_name, country=None, hwid_count: int = 0, tariff_name: str = "", traffic_limit: int = 0, device_limit: int = 0, subgroup_title: str = ""):
+    response_message = (
+        f"🔑 <b>Ваша подписка:</b>\n\n"
+        f"<code>{key}</code>\n\n"
+    )
+    tariff_lines = []
+    if subgroup_title and subgroup_title.strip():
+        tariff_lines.append(f"📁 Группа: {subgroup_title}")
+    if tariff_name:
+        tariff_lines.append(f"🕒 Тариф: {tariff_name}")
+    traffic = traffic_limit if traffic_limit is not None else 0
+    devices = device_limit if device_limit is not None else 0
+    if traffic > 0:
+        tariff_lines.append(f"📊 Трафик: {traffic} ГБ")
+    if devices > 0:
+        tariff_lines.append(f"📱 Лимит устройств: {devices}")
+    if tariff_lines:
+        response_message += "📦 Информация о тарифе:" + "<blockquote>" + "\n".join(tariff_lines) + "\n</blockquote>\n"
+
+    if device_limit is not None and device_limit > 0 and hwid_count > 0:
+        response_message += f"\n📱 <b>Подключенных устройств:</b> {hwid_count}\n\n"
+
+    response_message += (
+        f"📅 <b>Статус подписки:</b>\n"
+        f"<blockquote>{days_left_message}\n"
+        f"🛑 Истекает: {formatted_expiry_date}</blockquote>\n"
+    )
+    
+    if country:
+        response_message += f"🌍 <b>Локация:</b> {country}\n"
+
+    response_message += "\n<i>Подключите свое устройство по кнопкам ниже👇</i>"
+    return response_message
+
+
+def legacy_get_renewal_message(tariff_name: str = "", traffic_limit: int = 0, device_limit: int = 0, expiry_date: str = "", subgroup_title: str = "") -> str:
+    response_message = "✅ Ваша подписка была успешно продлена"
+    
+    tariff_lines = []
+    if subgroup_title and subgroup_title.strip():
+        tariff_lines.append(f"📁 Группа: {subgroup_title}")
+    if tariff_name:
+        tariff_lines.append(f"🕒 Тариф: {tariff_name}")
+    if traffic_limit is not None and traffic_limit > 0:
+        tariff_lines.append(f"📊 Трафик: {traffic_limit} ГБ")
+    if device_limit is not None and device_limit > 0:
+        tariff_lines.append(f"📱 Лимит устройств: {device_limit}")
+    
+    if tariff_lines:
+        response_message += "\n\n📦 Информация о тарифе:" + "<blockquote>" + "\n".join(tariff_lines) + "\n</blockquote>"
+    
+    if expiry_date and expiry_date.strip():
+        response_message += f"\n📅 Подписка продлена до <b>{expiry_date}</b>"
+    
+    return response_message
+
+
+CASES = (
+    (
+        "profile_message_send",
+        profile_message_send,
+        legacy_profile_message_send,
+        ("ivan_petrov", 123456789, 150, 2),
+        {},
+    ),
+    (
+        "key_message_success",
+        key_message_success,
+        legacy_key_message_success,
+        ("https://sub.example.com/abc",),
+        {"tariff_name": "1 месяц", "traffic_limit": 100, "device_limit": 3, "subgroup_title": "Основные"},
+    ),
+    (
+        "key_message",
+        key_message,
+        legacy_key_message,
+        ("https://sub.example.com/abc", "01.01.2026", "🟢 Осталось 10 дней", "nl-1"),
+        {"country": "🇳🇱 Нидерланды", "hwid_count": 2, "tariff_name": "1 месяц", "traffic_limit": 0, "device_limit": 3},
+    ),
+    (
+        "get_renewal_message",
+        get_renewal_message,
+        legacy_get_renewal_message,
+        (),
+        {"tariff_name": "3 месяца", "traffic_limit": 300, "device_limit": 0, "expiry_date": "01.04.2026"},
+    ),
+    (
+        "get_renewal_message (пусто)",
+        get_renewal_message,
+        legacy_get_renewal_message,
+        (),
+        {},
+    ),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+
+    for name, current, legacy, call_args, call_kwargs in CASES:
+        assert current(*call_args, **call_kwargs) == legacy(*call_args, **call_kwargs), name
+        new_time = timeit.timeit(lambda: current(*call_args, **call_kwargs), number=args.number)
+        old_time = timeit.timeit(lambda: legacy(*call_args, **call_kwargs), number=args.number)
+        print(
+            f"{name:<28} было {old_time / args.number * 1e6:6.2f} мкс   "
+            f"стало {new_time / args.number * 1e6:6.2f} мкс"
+        )
+
+    # Текст без подстановок CPython собирает в одну константу при компиляции модуля:
+    # функция каждый раз возвращает один и тот же объект, кэшировать нечего
+    assert get_about_vpn("a") is get_about_vpn("b")
+    about_time = timeit.timeit(lambda: get_about_vpn("bench"), number=args.number)
+    print(f"{'get_about_vpn':<28} {about_time / args.number * 1e6:6.2f} мкс (константа)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import asyncio
+import hmac
+import random
+import secrets
+import time
+
+from dataclasses import dataclass
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import check_user_exists
+from database.models import User
+from handlers.texts import CAPTCHA_EMOJIS, CAPTCHA_PROMPT_MSG
+from logger import logger
+
+
+CAPTCHA_POOL_SIZE = 256
+CAPTCHA_OPTIONS = 4
+CAPTCHA_ROTATE_INTERVAL = 600.0
+CAPTCHA_CALLBACK_PREFIX = "captcha_pool"
+# Неверных ответов подряд, после которых капча не выдается CAPTCHA_BLOCK_TIME секунд
+CAPTCHA_MAX_ATTEMPTS = 3
+CAPTCHA_BLOCK_TIME = 300.0
+KNOWN_USERS_REFRESH_INTERVAL = 600.0
+
+
+@dataclass(frozen=True, slots=True)
+class CaptchaTemplate:
+    text: str
+    emojis: tuple[str, ...]
+    answer: int
+
+
+@dataclass(frozen=True, slots=True)
+class CaptchaChallenge:
+    text: str
+    markup: InlineKeyboardMarkup
+    # Хранятся в FSM пользователя и на клиент не уходят (кроме как в callback_data кнопок)
+    nonce: str
+    answer_tag: str
+
+
+def parse_captcha_callback(data: str) -> tuple[str, str] | None:
+    """Разбирает callback_data вида captcha_pool|<nonce>|<tag>."""
+    parts = data.split("|")
+    if len(parts) != 3 or parts[0] != CAPTCHA_CALLBACK_PREFIX:
+        return None
+    return parts[1], parts[2]
+
+
+class CaptchaPool:
+    """
+    Пул заранее подготовленных капч (текст вопроса и набор вариантов), пересоздается раз
+    в rotate_interval. Кнопки собираются на каждую выдачу: у каждой выдачи свой nonce и
+    случайные метки кнопок, верная метка хранится только в FSM пользователя. Поэтому
+    ответ нельзя выучить по идентификатору капчи и переиспользовать для другого
+    пользователя или другой выдачи.
+    """
+
+    def __init__(
+        self,
+        size: int = CAPTCHA_POOL_SIZE,
+        options: int = CAPTCHA_OPTIONS,
+        rotate_interval: float = CAPTCHA_ROTATE_INTERVAL,
+    ):
+        self.size = size
+        self.options = min(options, len(CAPTCHA_EMOJIS))
+        self.rotate_interval = rotate_interval
+        self._templates: tuple[CaptchaTemplate, ...] = ()
+        self._rotated_at = 0.0
+
+    def _build(self) -> CaptchaTemplate:
+        emojis = tuple(random.sample(list(CAPTCHA_EMOJIS), self.options))
+        answer = random.randrange(self.options)
+        return CaptchaTemplate(
+            text=CAPTCHA_PROMPT_MSG.format(correct_text=CAPTCHA_EMOJIS[emojis[answer]]),
+            emojis=emojis,
+            answer=answer,
+        )
+
+    def rotate(self):
+        self._templates = tuple(self._build() for _ in range(self.size))
+        self._rotated_at = time.monotonic()
+
+    def issue(self) -> CaptchaChallenge:
+        if not self._templates or time.monotonic() - self._rotated_at >= self.rotate_interval:
+            self.rotate()
+        template = random.choice(self._templates)
+        nonce = secrets.token_urlsafe(6)
+        tags = [secrets.token_urlsafe(6) for _ in template.emojis]
+        buttons = [
+            InlineKeyboardButton(text=emoji, callback_data=f"{CAPTCHA_CALLBACK_PREFIX}|{nonce}|{tag}")
+            for emoji, tag in zip(template.emojis, tags)
+        ]
+        return CaptchaChallenge(
+            text=template.text,
+            markup=InlineKeyboardMarkup(inline_keyboard=[buttons]),
+            nonce=nonce,
+            answer_tag=tags[template.answer],
+        )
+
+    @staticmethod
+    def verify(expected_nonce: str | None, expected_tag: str | None, nonce: str, tag: str) -> bool:
+        if not expected_nonce or not expected_tag:
+            return False
+        return hmac.compare_digest(expected_nonce, nonce) and hmac.compare_digest(expected_tag, tag)
+
+
+class KnownUsers:
+    """
+    Множество tg_id зарегистрированных пользователей в памяти. Загружается в фоне при
+    первом обращении и затем перечитывается раз в refresh_interval; пользователи,
+    зарегистрированные в этом процессе, добавляются через add(). Пока загруженное
+    множество не старше refresh_interval, ответ дается только по нему, так что поток
+    /start от новых аккаунтов не нагружает БД. К check_user_exists обращение идет лишь
+    до первой загрузки или когда множество устарело (например, перечитать его не удалось).
+    Пользователь, зарегистрированный другим воркером после загрузки, до следующего
+    перечитывания увидит капчу еще раз.
+    """
+
+    def __init__(self, refresh_interval: float = KNOWN_USERS_REFRESH_INTERVAL, session_factory=None):
+        self.refresh_interval = refresh_interval
+        self._session_factory = session_factory
+        self._ids: set[int] | None = None
+        self._added_during_refresh: set[int] | None = None
+        self._refreshed_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            from database import async_session_maker
+
+            self._session_factory = async_session_maker
+        return self._session_factory
+
+    async def refresh(self):
+        self._added_during_refresh = set()
+        try:
+            async with self._get_session_factory()() as session:
+                result = await session.stream_scalars(select(User.tg_id).execution_options(yield_per=10_000))
+                ids = {tg_id async for tg_id in result}
+            self._ids = ids | self._added_during_refresh
+        except Exception as e:
+            logger.error(f"[Captcha] Не удалось загрузить список пользователей: {e}")
+        finally:
+            self._added_during_refresh = None
+            self._refreshed_at = time.monotonic()
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.refresh(), name="known_users_refresh")
+        return self._task
+
+    async def contains(self, session: AsyncSession, tg_id: int) -> bool:
+        fresh = self._refreshed_at != 0.0 and time.monotonic() - self._refreshed_at < self.refresh_interval
+        if not fresh:
+            self._start_refresh()
+
+        if self._ids is not None:
+            if tg_id in self._ids:
+                return True
+            if fresh:
+                return False
+        exists = await check_user_exists(session, tg_id)
+        if exists:
+            self.add(tg_id)
+        return exists
+
+    def add(self, tg_id: int):
+        if self._ids is not None:
+            self._ids.add(tg_id)
+        if self._added_during_refresh is not None:
+            self._added_during_refresh.add(tg_id)
+
+
+captcha_pool = CaptchaPool()
+known_users = KnownUsers()
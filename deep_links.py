@@ -0,0 +1,94 @@
+import re
+
+from typing import NamedTuple
+
+
+class CouponToken(NamedTuple):
+    raw: str
+    code: str
+
+
+class GiftToken(NamedTuple):
+    raw: str
+    gift_id: str
+
+
+class ReferralToken(NamedTuple):
+    raw: str
+    referrer_id: int | None
+
+
+class UtmToken(NamedTuple):
+    raw: str
+    code: str
+
+
+class HookToken(NamedTuple):
+    raw: str
+    prefix: str
+    value: str
+
+
+class UnknownToken(NamedTuple):
+    raw: str
+
+
+StartToken = CouponToken | GiftToken | ReferralToken | UtmToken | HookToken | UnknownToken
+
+BUILTIN_PREFIXES = ("coupons", "gift", "referral", "utm")
+
+_hook_prefixes: set[str] = set()
+_pattern: re.Pattern[str]
+
+
+def _compile():
+    global _pattern
+    # Длинные префиксы первыми, чтобы "gifts" не разбирался как "gift" + "s"
+    prefixes = sorted({*BUILTIN_PREFIXES, *_hook_prefixes}, key=len, reverse=True)
+    _pattern = re.compile(rf"({'|'.join(map(re.escape, prefixes))})_*(.*)", re.DOTALL)
+
+
+def register_link_prefix(prefix: str):
+    """
+    Регистрирует префикс части deep-link, который разбирается в HookToken. Хук start_link
+    получает часть как part и может разобрать ее через parse_token(part).
+    """
+    if not prefix or "-" in prefix:
+        raise ValueError(f"Недопустимый префикс deep-link: {prefix!r}")
+    if prefix in BUILTIN_PREFIXES or prefix in _hook_prefixes:
+        return
+    _hook_prefixes.add(prefix)
+    _compile()
+
+
+def parse_token(part: str) -> StartToken:
+    match = _pattern.match(part)
+    if match is None:
+        return UnknownToken(part)
+
+    prefix, value = match.groups()
+    if prefix == "coupons":
+        return CouponToken(part, value.strip("_"))
+    if prefix == "gift":
+        return GiftToken(part, value.strip("_"))
+    if prefix == "referral":
+        value = value.strip("_")
+        return ReferralToken(part, int(value) if value.isascii() and value.isdigit() else None)
+    if prefix == "utm":
+        # Код источника в БД хранится целиком вместе с префиксом
+        return UtmToken(part, part)
+    return HookToken(part, prefix, value)
+
+
+def parse_start_payload(payload: str) -> tuple[StartToken, ...]:
+    """Разбирает payload команды /start на части через "-". Части после подарка не обрабатываются."""
+    tokens = []
+    for part in payload.split("-"):
+        token = parse_token(part)
+        tokens.append(token)
+        if isinstance(token, GiftToken):
+            break
+    return tuple(tokens)
+
+
+_compile()
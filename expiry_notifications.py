@@ -0,0 +1,462 @@
+import asyncio
+import json
+import os
+import time
+
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from sqlalchemy import and_, select, tuple_, update
+
+from database.models import Key
+from handlers.buttons import RENEW_KEY_NOTIFICATION
+from handlers.texts import KEY_DELETED_MSG, KEY_EXPIRED_DELAY_MSG, KEY_EXPIRY_10H, KEY_EXPIRY_24H
+from logger import logger
+
+from .menu_keyboards import PROFILE_ROW, copy_row
+from .send_scheduler import bulk_sends
+
+
+NOTIFY_BATCH_SIZE = 1_000
+NOTIFY_WORKERS = 20
+NOTIFY_SWEEP_INTERVAL = 300.0
+# Попыток для уведомлений без флага в Key (истекшие ключи), после чего ключ пропускается
+NOTIFY_MAX_ATTEMPTS = 5
+NOTIFY_CHECKPOINT_FILE = os.path.join("logs", "expiry_notifications.json")
+# Журнал ведется отдельным файлом на вид уведомлений: <NOTIFY_JOURNAL_FILE>.<kind>
+NOTIFY_JOURNAL_FILE = os.path.join("logs", "expiry_notifications.journal")
+# Проходы запускаются при старте бота (start.py). Включать только вместе с отключением
+# внешней задачи уведомлений, иначе уведомления уйдут дважды
+NOTIFY_ENABLED = False
+# Задержка удаления истекшего ключа, о которой говорит KEY_EXPIRED_DELAY_MSG
+NOTIFY_DELETE_DELAY_MINUTES = 0
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+HOUR_MS = 3_600_000
+
+
+@dataclass(frozen=True, slots=True)
+class NotificationKind:
+    name: str
+    template: str
+    # Флаг Key, который ставится после отправки; None — дедупликация только по окну expiry_time
+    flag: str | None
+    # Окно expiry_time относительно начала прохода, в мс
+    window_from: int
+    window_to: int
+
+
+KIND_24H = NotificationKind("24h", KEY_EXPIRY_24H, "notified_24h", 10 * HOUR_MS, 24 * HOUR_MS)
+KIND_10H = NotificationKind("10h", KEY_EXPIRY_10H, "notified", 0, 10 * HOUR_MS)
+KIND_EXPIRED = NotificationKind("expired", KEY_EXPIRED_DELAY_MSG, None, 0, 0)
+KINDS = (KIND_24H, KIND_10H, KIND_EXPIRED)
+
+
+@dataclass(frozen=True, slots=True)
+class Notification:
+    client_id: str
+    tg_id: int
+    text: str
+    reply_markup: InlineKeyboardMarkup
+
+
+def _format_hours(ms_left: int) -> str:
+    hours = max(ms_left // HOUR_MS, 0)
+    return f"⏳ Осталось: {hours} ч." if hours else "⏳ Осталось меньше часа"
+
+
+def _format_delay(minutes: int) -> str:
+    hours, minutes = divmod(minutes, 60)
+    if hours and minutes:
+        return f"{hours} ч. {minutes} мин."
+    return f"{hours} ч." if hours else f"{minutes} мин."
+
+
+def _notification_markup(email: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text=RENEW_KEY_NOTIFICATION, callback_data=f"renew_key|{email}")],
+            copy_row(PROFILE_ROW),
+        ]
+    )
+
+
+class ExpiryNotifier:
+    """
+    Проходы по ключам с уведомлениями об окончании подписки.
+
+    Ключи выбираются пачками по индексу (expiry_time, client_id) с keyset-пагинацией,
+    тексты всей пачки рендерятся сразу, отправка идет через пул воркеров в фоновой
+    очереди планировщика отправок. Каждая успешная отправка сразу пишется в журнал
+    (с fsync), затем флаги пачки ставятся одним UPDATE, и курсор прохода сохраняется
+    в checkpoint. После перезапуска журнал доигрывается в БД, а проход продолжается
+    с курсора, поэтому уведомления не дублируются и не теряются. Для уведомлений без
+    флага (истекшие ключи) неудачные отправки сохраняются в checkpoint и повторяются
+    в следующих проходах, до NOTIFY_MAX_ATTEMPTS попыток.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        session_factory=None,
+        delete_delay_minutes: int = 0,
+        batch_size: int = NOTIFY_BATCH_SIZE,
+        workers: int = NOTIFY_WORKERS,
+        checkpoint_file: str = NOTIFY_CHECKPOINT_FILE,
+        journal_file: str = NOTIFY_JOURNAL_FILE,
+    ):
+        self.bot = bot
+        self.delete_delay_minutes = delete_delay_minutes
+        self.batch_size = batch_size
+        self.workers = workers
+        self.checkpoint_file = checkpoint_file
+        self.journal_file = journal_file
+        self._session_factory = session_factory
+        self._checkpoint: dict[str, dict] = {}
+        self._journaled: dict[str, set[str]] = {}
+        self._lock = asyncio.Lock()
+        self._recovered = False
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            from database import async_session_maker
+
+            self._session_factory = async_session_maker
+        return self._session_factory
+
+    # --- checkpoint и журнал ---
+
+    # Запись с fsync блокирует поток, поэтому выполняется через asyncio.to_thread
+
+    def _write_checkpoint(self, payload: str):
+        os.makedirs(os.path.dirname(self.checkpoint_file) or ".", exist_ok=True)
+        tmp_path = f"{self.checkpoint_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_file)
+
+    async def _save_checkpoint(self):
+        await asyncio.to_thread(self._write_checkpoint, json.dumps(self._checkpoint))
+
+    def _journal_path(self, kind_name: str) -> str:
+        return f"{self.journal_file}.{kind_name}"
+
+    def _write_journal(self, path: str, line: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _journal(self, kind: NotificationKind, client_id: str):
+        line = json.dumps({"kind": kind.name, "client_id": client_id}) + "\n"
+        await asyncio.to_thread(self._write_journal, self._journal_path(kind.name), line)
+
+    def _rewrite_journal(self, path: str, lines: list[str]):
+        if not lines:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    async def _truncate_journal(self, kind: NotificationKind, keep: Iterable[str] = ()):
+        """
+        Очищает журнал вида после сохранения курсора. В журнале остаются только keep —
+        отправки до аварийной остановки, которые курсор текущего прохода мог еще не пройти.
+        """
+        lines = [json.dumps({"kind": kind.name, "client_id": client_id}) + "\n" for client_id in keep]
+        await asyncio.to_thread(self._rewrite_journal, self._journal_path(kind.name), lines)
+
+    async def recover(self):
+        """Загружает checkpoint и ставит флаги по отправкам, которые не успели попасть в БД."""
+        try:
+            with open(self.checkpoint_file, encoding="utf-8") as f:
+                self._checkpoint = json.load(f)
+        except FileNotFoundError:
+            self._checkpoint = {}
+
+        journaled: dict[str, set[str]] = {}
+        for kind in KINDS:
+            try:
+                with open(self._journal_path(kind.name), encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # Недописанная строка при аварийной остановке
+                            continue
+                        journaled.setdefault(kind.name, set()).add(entry["client_id"])
+            except FileNotFoundError:
+                pass
+
+        async with self._get_session_factory()() as session:
+            for kind in KINDS:
+                if kind.flag is not None and kind.name in journaled:
+                    await self._mark(session, kind, journaled[kind.name])
+            await session.commit()
+
+        # Ключи без флага пропускаются по журналу до конца прерванного прохода
+        self._journaled = {}
+        for kind in KINDS:
+            if kind.flag is None and kind.name in journaled:
+                self._journaled[kind.name] = journaled[kind.name]
+            elif kind.name in journaled:
+                await self._truncate_journal(kind)
+        self._recovered = True
+
+    # --- выборка и рендеринг ---
+
+    def _window(self, kind: NotificationKind, state: dict, now_ms: int) -> tuple[int, int]:
+        if kind.flag is None:
+            return state.get("since", now_ms), state["until"]
+        return now_ms + kind.window_from, now_ms + kind.window_to
+
+    async def _fetch(self, session, kind: NotificationKind, low: int, high: int, cursor: list | None) -> list:
+        conditions = [Key.expiry_time > low, Key.expiry_time <= high]
+        if kind.flag is not None:
+            conditions.append(getattr(Key, kind.flag).is_(False))
+        if cursor is not None:
+            conditions.append(tuple_(Key.expiry_time, Key.client_id) > tuple(cursor))
+        stmt = (
+            select(Key.client_id, Key.tg_id, Key.email, Key.expiry_time)
+            .where(and_(*conditions))
+            .order_by(Key.expiry_time, Key.client_id)
+            .limit(self.batch_size)
+        )
+        return (await session.execute(stmt)).all()
+
+    def _render(self, kind: NotificationKind, rows: list, now_ms: int) -> list[Notification]:
+        if kind is KIND_EXPIRED:
+            time_formatted = _format_delay(self.delete_delay_minutes)
+            return [
+                Notification(
+                    row.client_id,
+                    row.tg_id,
+                    kind.template.format(email=row.email, time_formatted=time_formatted),
+                    _notification_markup(row.email),
+                )
+                for row in rows
+            ]
+        return [
+            Notification(
+                row.client_id,
+                row.tg_id,
+                kind.template.format(
+                    email=row.email,
+                    hours_left_formatted=_format_hours(row.expiry_time - now_ms),
+                    formatted_expiry_date=datetime.fromtimestamp(row.expiry_time / 1000, MOSCOW_TZ).strftime(
+                        "%d.%m.%Y %H:%M"
+                    ),
+                ),
+                _notification_markup(row.email),
+            )
+            for row in rows
+        ]
+
+    # --- отправка ---
+
+    async def _send(self, notification: Notification) -> bool:
+        """True, если уведомление больше не нужно отправлять (доставлено или чат недоступен)."""
+        try:
+            await self.bot.send_message(notification.tg_id, notification.text, reply_markup=notification.reply_markup)
+            return True
+        except TelegramForbiddenError:
+            return True
+        except TelegramBadRequest as e:
+            if "chat not found" in str(e).lower():
+                return True
+            logger.error(f"[Notify] Ошибка отправки {notification.client_id}: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"[Notify] Ошибка отправки {notification.client_id}: {e}")
+            return False
+
+    async def dispatch(self, notifications: list[Notification], kind: NotificationKind | None = None) -> list[Notification]:
+        """
+        Отправляет уведомления пулом из workers задач и возвращает обработанные.
+        Если передан kind, каждое обработанное уведомление пишется в журнал сразу после отправки.
+        """
+        queue: asyncio.Queue[Notification] = asyncio.Queue()
+        for notification in notifications:
+            queue.put_nowait(notification)
+        done: list[Notification] = []
+
+        async def worker():
+            while True:
+                try:
+                    notification = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if await self._send(notification):
+                    if kind is not None:
+                        await self._journal(kind, notification.client_id)
+                    done.append(notification)
+
+        with bulk_sends():
+            await asyncio.gather(*(worker() for _ in range(min(self.workers, len(notifications)))))
+        return done
+
+    async def _mark(self, session, kind: NotificationKind, client_ids: Iterable[str]):
+        client_ids = list(client_ids)
+        for i in range(0, len(client_ids), self.batch_size):
+            await session.execute(
+                update(Key).where(Key.client_id.in_(client_ids[i : i + self.batch_size])).values({kind.flag: True})
+            )
+
+    # --- проходы ---
+
+    def _track_failures(self, state: dict, pending: list, done_ids: set[str]):
+        """Запоминает неудачные отправки без флага в Key, чтобы окно прохода не ушло дальше них."""
+        retry = state.setdefault("retry", {})
+        for row in pending:
+            if row.client_id in done_ids:
+                retry.pop(row.client_id, None)
+                continue
+            attempts = retry.get(row.client_id, 0) + 1
+            if attempts >= NOTIFY_MAX_ATTEMPTS:
+                retry.pop(row.client_id, None)
+                logger.error(f"[Notify] Уведомление {row.client_id} не доставлено за {attempts} попыток, пропуск")
+            else:
+                retry[row.client_id] = attempts
+
+    async def _retry_failed(self, kind: NotificationKind, state: dict, skip: set[str], now_ms: int) -> int:
+        retry = state.get("retry") or {}
+        # Доставленные до аварийной остановки (по журналу) больше не повторяются
+        for client_id in skip:
+            retry.pop(client_id, None)
+        retry_ids = list(retry)
+        if not retry_ids:
+            return 0
+        sent = 0
+        found: set[str] = set()
+        for i in range(0, len(retry_ids), self.batch_size):
+            async with self._get_session_factory()() as session:
+                stmt = select(Key.client_id, Key.tg_id, Key.email, Key.expiry_time).where(
+                    Key.client_id.in_(retry_ids[i : i + self.batch_size])
+                )
+                rows = (await session.execute(stmt)).all()
+            found.update(row.client_id for row in rows)
+            done = await self.dispatch(self._render(kind, rows, now_ms), kind)
+            done_ids = {notification.client_id for notification in done}
+            self._track_failures(state, rows, done_ids)
+            sent += len(done_ids)
+        # Удаленные ключи повторять некому
+        for client_id in set(retry_ids) - found:
+            retry.pop(client_id, None)
+        await self._save_checkpoint()
+        return sent
+
+    async def sweep(self, kind: NotificationKind) -> int:
+        """Один проход по виду уведомлений. Возвращает число отправленных."""
+        now_ms = int(time.time() * 1000)
+        state = self._checkpoint.get(kind.name)
+        if state is None or "until" not in state:
+            # Новый проход; для истекших ключей окно продолжает предыдущее
+            previous = state or {}
+            state = self._checkpoint[kind.name] = {
+                "since": previous.get("since", now_ms),
+                "until": now_ms,
+                "cursor": None,
+                "retry": previous.get("retry", {}),
+            }
+            await self._save_checkpoint()
+
+        low, high = self._window(kind, state, now_ms)
+        # Отправленные до аварийной остановки: действуют до конца прохода, пока курсор их не прошел
+        skip = self._journaled.get(kind.name, set())
+        sent = 0
+        if kind.flag is None:
+            sent += await self._retry_failed(kind, state, skip, now_ms)
+
+        session_factory = self._get_session_factory()
+        while True:
+            async with session_factory() as session:
+                rows = await self._fetch(session, kind, low, high, state["cursor"])
+                if not rows:
+                    break
+
+                pending = [row for row in rows if row.client_id not in skip]
+                done = await self.dispatch(self._render(kind, pending, now_ms), kind)
+                done_ids = [notification.client_id for notification in done]
+                if kind.flag is not None and done_ids:
+                    await self._mark(session, kind, done_ids)
+                    await session.commit()
+
+            if kind.flag is None:
+                self._track_failures(state, pending, set(done_ids))
+            sent += len(done_ids)
+            state["cursor"] = [rows[-1].expiry_time, rows[-1].client_id]
+            await self._save_checkpoint()
+            await self._truncate_journal(kind, skip)
+
+        # Проход завершен: курсор сбрасывается. Ключи с флагом, которые не удалось уведомить,
+        # попадут в следующий проход по флагу, без флага — через retry
+        self._checkpoint[kind.name] = {"since": state["until"], "retry": state.get("retry", {})}
+        await self._save_checkpoint()
+        self._journaled.pop(kind.name, None)
+        await self._truncate_journal(kind)
+        if sent:
+            logger.info(f"[Notify] {kind.name}: отправлено {sent} уведомлений")
+        return sent
+
+    async def sweep_all(self) -> bool:
+        """Проходит все виды уведомлений; если предыдущий проход еще идет, новый пропускается."""
+        if self._lock.locked():
+            logger.warning("[Notify] Предыдущий проход уведомлений еще не завершен, пропуск")
+            return False
+        async with self._lock:
+            if not self._recovered:
+                await self.recover()
+            for kind in KINDS:
+                try:
+                    await self.sweep(kind)
+                except Exception as e:
+                    logger.error(f"[Notify] Ошибка прохода {kind.name}: {e}")
+        return True
+
+    async def run(self, interval: float = NOTIFY_SWEEP_INTERVAL):
+        while True:
+            started = time.monotonic()
+            await self.sweep_all()
+            await asyncio.sleep(max(interval - (time.monotonic() - started), 0))
+
+    async def notify_deleted(self, keys: Iterable[tuple[int, str]]) -> int:
+        """Рассылает KEY_DELETED_MSG по парам (tg_id, email) удаленных ключей."""
+        markup = InlineKeyboardMarkup(inline_keyboard=[copy_row(PROFILE_ROW)])
+        notifications = [
+            Notification(email, tg_id, KEY_DELETED_MSG.format(email=email), markup) for tg_id, email in keys
+        ]
+        return len(await self.dispatch(notifications))
+
+
+_notifier_task: asyncio.Task | None = None
+
+
+def start_expiry_notifier(bot: Bot) -> asyncio.Task:
+    """Запускает периодические проходы уведомлений фоновой задачей."""
+    global _notifier_task
+    if _notifier_task is None or _notifier_task.done():
+        notifier = ExpiryNotifier(bot, delete_delay_minutes=NOTIFY_DELETE_DELAY_MINUTES)
+        _notifier_task = asyncio.create_task(notifier.run(), name="expiry_notifier")
+    return _notifier_task
+
+
+async def stop_expiry_notifier():
+    if _notifier_task is not None and not _notifier_task.done():
+        _notifier_task.cancel()
+        try:
+            await _notifier_task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,182 @@
+import base64
+import marshal
+import pickle
+import time
+import zlib
+
+from collections import OrderedDict
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from logger import logger
+
+
+FSM_IDLE_TTL = 3600.0
+FSM_MAX_RECORDS = 200_000
+# Данные крупнее порога дополнительно сжимаются
+FSM_COMPRESS_THRESHOLD = 512
+
+# Первый байт записи — флаги формата
+_ZLIB = 0x01
+_PICKLE = 0x02
+
+# TTL для отдельных состояний, например коротких диалогов ввода
+_state_ttls: dict[str, float] = {}
+
+
+def register_state_ttl(state: State | str, ttl: float):
+    """Задает время жизни записи, пока пользователь находится в этом состоянии."""
+    _state_ttls[state.state if isinstance(state, State) else state] = ttl
+
+
+def dumps_data(data: dict[str, Any], allow_pickle: bool = True) -> bytes:
+    """
+    Компактная бинарная сериализация данных FSM через marshal (dict/list/str/int/float/None).
+    Данные с другими типами (datetime, dataclass и т.п.) сериализуются через pickle, если
+    allow_pickle, иначе выбрасывается TypeError.
+    """
+    flags = 0
+    try:
+        payload = marshal.dumps(data)
+    except ValueError as e:
+        if not allow_pickle:
+            raise TypeError(f"Данные FSM должны состоять из простых типов: {e}") from e
+        payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        flags |= _PICKLE
+    if len(payload) > FSM_COMPRESS_THRESHOLD:
+        payload = zlib.compress(payload)
+        flags |= _ZLIB
+    return bytes((flags,)) + payload
+
+
+def loads_data(raw: bytes | None, allow_pickle: bool = True) -> dict[str, Any]:
+    if not raw:
+        return {}
+    try:
+        flags = raw[0]
+        payload = zlib.decompress(raw[1:]) if flags & _ZLIB else raw[1:]
+        if flags & _PICKLE:
+            if not allow_pickle:
+                raise TypeError("pickle отключен для этого хранилища")
+            return pickle.loads(payload)
+        return marshal.loads(payload)
+    except (ValueError, EOFError, TypeError, AttributeError, ImportError, zlib.error, pickle.UnpicklingError) as e:
+        # Например, запись из другой версии Python: состояние проще начать заново
+        logger.warning(f"[FSM] Не удалось прочитать данные состояния: {e}")
+        return {}
+
+
+def dumps_text(data: dict[str, Any]) -> str:
+    """
+    Текстовый вариант dumps_data для RedisStorage: aiogram декодирует прочитанное значение
+    как UTF-8 до вызова json_loads, поэтому бинарные данные передаются в base64.
+    pickle не используется — данные в общем Redis не должны исполнять код при чтении.
+    """
+    return base64.b64encode(dumps_data(data, allow_pickle=False)).decode("ascii")
+
+
+def loads_text(value: str | bytes | None) -> dict[str, Any]:
+    if not value:
+        return {}
+    try:
+        raw = base64.b64decode(value, validate=True)
+    except ValueError as e:
+        logger.warning(f"[FSM] Не удалось прочитать данные состояния: {e}")
+        return {}
+    return loads_data(raw, allow_pickle=False)
+
+
+class TTLMemoryStorage(BaseStorage):
+    """
+    Хранилище FSM в памяти процесса. В отличие от MemoryStorage, запись не создается
+    при чтении, удаляется после clear() и вытесняется, если пользователь не трогал
+    состояние дольше idle_ttl (или TTL своего состояния, см. register_state_ttl).
+    Данные хранятся сериализованными через dumps_data; как и MemoryStorage, принимает
+    любые pickle-совместимые значения.
+    """
+
+    def __init__(self, idle_ttl: float = FSM_IDLE_TTL, maxsize: int = FSM_MAX_RECORDS):
+        self.idle_ttl = idle_ttl
+        self.maxsize = maxsize
+        # key -> [state, data, expires_at]; порядок — по последнему обращению
+        self._records: OrderedDict[StorageKey, list] = OrderedDict()
+
+    def _evict(self, now: float):
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if record[2] > now and len(self._records) <= self.maxsize:
+                break
+            del self._records[key]
+
+    def _get(self, key: StorageKey) -> list | None:
+        record = self._records.get(key)
+        if record is None:
+            return None
+        now = time.monotonic()
+        if record[2] <= now:
+            del self._records[key]
+            return None
+        record[2] = now + _state_ttls.get(record[0], self.idle_ttl)
+        self._records.move_to_end(key)
+        return record
+
+    def _put(self, key: StorageKey, state: str | None, data: bytes | None):
+        if state is None and data is None:
+            self._records.pop(key, None)
+            return
+        now = time.monotonic()
+        self._records[key] = [state, data, now + _state_ttls.get(state, self.idle_ttl)]
+        self._records.move_to_end(key)
+        self._evict(now)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._get(key)
+        state = state.state if isinstance(state, State) else state
+        self._put(key, state, record[1] if record else None)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        record = self._get(key)
+        return record[0] if record else None
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        record = self._get(key)
+        self._put(key, record[0] if record else None, dumps_data(data) if data else None)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        record = self._get(key)
+        return loads_data(record[1]) if record else {}
+
+    async def close(self) -> None:
+        self._records.clear()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+def create_redis_storage(redis, state_ttl: float = FSM_IDLE_TTL, data_ttl: float = FSM_IDLE_TTL) -> BaseStorage:
+    """
+    RedisStorage с TTL записей и компактной сериализацией данных (marshal, zlib и base64,
+    см. dumps_text). Как и JSON по умолчанию в aiogram, принимает только простые типы:
+    для datetime и других объектов set_data выбрасывает TypeError.
+    """
+    from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
+
+    return RedisStorage(
+        redis,
+        key_builder=DefaultKeyBuilder(),
+        state_ttl=int(state_ttl),
+        data_ttl=int(data_ttl),
+        json_loads=loads_text,
+        json_dumps=dumps_text,
+    )
+
+
+def create_fsm_storage(redis_url: str | None = None) -> BaseStorage:
+    """Хранилище FSM для Dispatcher: Redis, если указан адрес, иначе TTLMemoryStorage."""
+    if redis_url:
+        from redis.asyncio import Redis
+
+        return create_redis_storage(Redis.from_url(redis_url))
+    return TTLMemoryStorage()
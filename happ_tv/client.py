@@ -0,0 +1,105 @@
+import asyncio
+import base64
+import random
+
+import aiohttp
+
+from logger import logger
+
+from .settings import (
+    HAPP_TV_API_URL,
+    HAPP_TV_CONNECT_TIMEOUT,
+    HAPP_TV_DNS_CACHE_TTL,
+    HAPP_TV_KEEPALIVE_TIMEOUT,
+    HAPP_TV_MAX_CONCURRENCY,
+    HAPP_TV_MAX_CONNECTIONS,
+    HAPP_TV_REQUEST_TIMEOUT,
+    HAPP_TV_RETRIES,
+    HAPP_TV_RETRY_BACKOFF,
+)
+
+
+class HappTVClient:
+    """
+    Общий HTTP-клиент для check.happ.su: один пул соединений с keep-alive и кэшем DNS
+    на весь процесс, ограничение параллельных запросов, дедлайн на запрос и повторы
+    со случайной задержкой при 5xx и сетевых ошибках.
+    """
+
+    def __init__(
+        self,
+        base_url: str = HAPP_TV_API_URL,
+        *,
+        timeout: float = HAPP_TV_REQUEST_TIMEOUT,
+        connect_timeout: float = HAPP_TV_CONNECT_TIMEOUT,
+        retries: int = HAPP_TV_RETRIES,
+        backoff: float = HAPP_TV_RETRY_BACKOFF,
+        max_connections: int = HAPP_TV_MAX_CONNECTIONS,
+        max_concurrency: int = HAPP_TV_MAX_CONCURRENCY,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                ttl_dns_cache=HAPP_TV_DNS_CACHE_TTL,
+                keepalive_timeout=HAPP_TV_KEEPALIVE_TIMEOUT,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def send_tv(self, code: str, subscription_link: str) -> bool:
+        payload = {"data": base64.b64encode(subscription_link.encode()).decode()}
+        url = f"{self.base_url}/sendtv/{code}"
+
+        # Дедлайн считается с момента вызова: ожидание в очереди семафора входит в него
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"[HappTV] Превышено время ожидания очереди отправки ({self.timeout}с)")
+            return False
+
+        try:
+            session = self._get_session()
+
+            for attempt in range(self.retries + 1):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                timeout = aiohttp.ClientTimeout(total=remaining, connect=min(self.connect_timeout, remaining))
+                try:
+                    async with session.post(url, json=payload, timeout=timeout) as resp:
+                        if resp.status == 200:
+                            return True
+                        text = await resp.text()
+                        logger.error(f"[HappTV] API error {resp.status}: {text}")
+                        if resp.status < 500:
+                            return False
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.error(f"[HappTV] Network error (попытка {attempt + 1}): {e!r}")
+
+                if attempt < self.retries:
+                    delay = self.backoff * (2**attempt) * random.uniform(0.5, 1.5)
+                    await asyncio.sleep(max(0.0, min(delay, deadline - loop.time())))
+        finally:
+            self._semaphore.release()
+
+        return False
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+happ_tv_client = HappTVClient()
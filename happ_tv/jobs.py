@@ -0,0 +1,105 @@
+import asyncio
+
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+from aiogram.types import Message
+
+from logger import logger
+
+from .client import HappTVClient
+from .settings import HAPP_TV_QUEUE_SIZE, HAPP_TV_WORKERS
+
+
+@dataclass
+class HappTVJob:
+    code: str
+    key_name: str
+    subscription_link: str
+    status_messages: list[Message] = field(default_factory=list)
+    # Воркер работает вне апдейта, поэтому локаль пользователя сохраняется в задаче
+    locale: str | None = None
+
+
+OnJobDone = Callable[[HappTVJob, bool], Awaitable[None]]
+
+
+class HappTVJobQueue:
+    """
+    Очередь фоновых отправок на Happ TV с пулом воркеров.
+    Повторные отправки той же пары (code, key_name), пока первая еще в работе,
+    склеиваются в одну задачу: результат получат все статусные сообщения.
+    """
+
+    def __init__(
+        self,
+        client: HappTVClient,
+        on_done: OnJobDone,
+        workers: int = HAPP_TV_WORKERS,
+        maxsize: int = HAPP_TV_QUEUE_SIZE,
+    ):
+        self.client = client
+        self.on_done = on_done
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue: asyncio.Queue[HappTVJob] | None = None
+        self._pending: dict[tuple[str, str], HappTVJob] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [task for task in self._tasks if not task.done()]
+        for i in range(len(self._tasks), self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(), name=f"happ_tv_worker_{i}"))
+
+    def submit(
+        self, code: str, key_name: str, subscription_link: str, status_message: Message, locale: str | None = None
+    ) -> bool:
+        job = self._pending.get((code, key_name))
+        if job is not None:
+            job.status_messages.append(status_message)
+            return True
+
+        self._ensure_started()
+        job = HappTVJob(code, key_name, subscription_link, [status_message], locale)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            logger.error(f"[HappTV] Очередь отправок переполнена ({self.maxsize}), код {code} отклонен")
+            return False
+        self._pending[(code, key_name)] = job
+        return True
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job: HappTVJob):
+        ok = False
+        try:
+            ok = await self.client.send_tv(job.code, job.subscription_link)
+        except Exception as e:
+            logger.error(f"[HappTV] Ошибка фоновой отправки: {e}")
+        finally:
+            self._pending.pop((job.code, job.key_name), None)
+
+        try:
+            await self.on_done(job, ok)
+        except Exception as e:
+            logger.error(f"[HappTV] Ошибка обновления статуса отправки: {e}")
+
+    async def close(self, timeout: float = 10):
+        if self._queue is not None and self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"[HappTV] Не дождались {self._queue.qsize()} отправок при остановке")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -1,24 +1,60 @@
+import os
+
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import CallbackQuery, InlineKeyboardButton
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from hooks.hooks import register_hook
+from database import get_key_details
+from handlers.buttons import BACK
+from handlers.fsm_storage import register_state_ttl
+from handlers.hook_dispatch import register_hook
+from handlers.i18n import LocaleMiddleware, catalog
+from handlers.lazy_modules import lazy
+from handlers.metrics import HandlerMetricsMiddleware
+from handlers.utils import edit_or_send_message
 from logger import logger
 
+from .client import happ_tv_client
+from .jobs import HappTVJob, HappTVJobQueue
+from .settings import HAPP_TV_STATE_TTL
+
+
+KEY_VIEW_IMAGE = os.path.join("img", "pic_view.jpg")
+
+# key_view импортирует хуки и клавиатуры ключей: загружается при первой отмене, а не при старте
+render_key_info = lazy("handlers.keys.key_view", "render_key_info")
 
 router = Router(name="happ_tv_module")
+router.message.middleware(LocaleMiddleware())
+router.callback_query.middleware(LocaleMiddleware())
+router.message.middleware(HandlerMetricsMiddleware())
+router.callback_query.middleware(HandlerMetricsMiddleware())
+catalog.register_namespace("happ_tv", f"{__package__}.texts")
+
+
+def _text(msg_id: str) -> str:
+    return catalog.get(msg_id, namespace="happ_tv")
 
 
 class HappTVStates(StatesGroup):
     waiting_for_code = State()
 
 
+register_state_ttl(HappTVStates.waiting_for_code, HAPP_TV_STATE_TTL)
+
+
 def _build_happ_button(key_name: str) -> InlineKeyboardButton:
     return InlineKeyboardButton(text="📺 Подключить Happ TV", callback_data=f"happ_tv|{key_name}")
 
 
+def _build_back_markup(key_name: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="🔙 Назад", callback_data=f"happ_tv_cancel|{key_name}")]]
+    )
+
+
 async def view_key_menu_hook(key_name: str, session=None, **kwargs):
     try:
         remove_tv = {"remove": [f"connect_tv|{key_name}"], "remove_prefix": None}
@@ -35,72 +71,63 @@ async def start_happ_tv(callback: CallbackQuery, state: FSMContext):
     await state.update_data(key_name=key_name)
     await state.set_state(HappTVStates.waiting_for_code)
 
-    from .texts import HAPP_TV_CODE_REQUEST
-    from handlers.buttons import BACK
-    from handlers.utils import edit_or_send_message
-
     kb = InlineKeyboardBuilder()
 
     kb.row(InlineKeyboardButton(text=BACK, callback_data=f"happ_tv_cancel|{key_name}"))
 
     await edit_or_send_message(
         target_message=callback.message,
-        text=HAPP_TV_CODE_REQUEST,
+        text=_text("HAPP_TV_CODE_REQUEST"),
         reply_markup=kb.as_markup(),
     )
 
 
 @router.message(F.text, HappTVStates.waiting_for_code)
-async def on_code_entered(message, state: FSMContext, session):
+async def on_code_entered(message, state: FSMContext, session, locale: str | None = None):
     data = await state.get_data()
     key_name = data.get("key_name")
 
-    from database import get_key_details
-    from .texts import HAPP_TV_ERROR, HAPP_TV_INVALID_CODE, HAPP_TV_SUCCESS
-    from handlers.utils import edit_or_send_message
-
     code = (message.text or "").strip()
 
     if not (len(code) == 5 and code.isalnum()):
-        kb = InlineKeyboardBuilder()
-        kb.row(InlineKeyboardButton(text="🔙 Назад", callback_data=f"happ_tv_cancel|{key_name}"))
-        await edit_or_send_message(target_message=message, text=HAPP_TV_INVALID_CODE, reply_markup=kb.as_markup())
+        await edit_or_send_message(
+            target_message=message, text=_text("HAPP_TV_INVALID_CODE"), reply_markup=_build_back_markup(key_name)
+        )
         return
 
     record = await get_key_details(session, key_name)
     subscription_link = record.get("key") or record.get("remnawave_link")
     if not subscription_link:
-        await edit_or_send_message(target_message=message, text=HAPP_TV_ERROR, reply_markup=None)
+        await edit_or_send_message(target_message=message, text=_text("HAPP_TV_ERROR"), reply_markup=None)
         await state.clear()
         return
 
-    import base64
-    import aiohttp
+    # Отправка идет в фоне, FSM освобождаем сразу
+    await state.clear()
+    status_message = await message.answer(_text("HAPP_TV_SENDING"), reply_markup=_build_back_markup(key_name))
+    if not happ_tv_jobs.submit(code, key_name, subscription_link, status_message, locale):
+        await status_message.edit_text(_text("HAPP_TV_ERROR"), reply_markup=_build_back_markup(key_name))
 
-    payload = {"data": base64.b64encode(subscription_link.encode()).decode()}
-    url = f"https://check.happ.su/sendtv/{code}"
 
-    ok = False
-    try:
-        async with aiohttp.ClientSession() as s:
-            async with s.post(url, json=payload, timeout=15) as resp:
-                ok = resp.status == 200
-                if not ok:
-                    text = await resp.text()
-                    logger.error(f"[HappTV] API error {resp.status}: {text}")
-    except Exception as e:
-        logger.error(f"[HappTV] Network error: {e}")
+async def _on_send_done(job: HappTVJob, ok: bool):
+    text = catalog.get("HAPP_TV_SUCCESS" if ok else "HAPP_TV_ERROR", job.locale, namespace="happ_tv")
+    for status_message in job.status_messages:
+        try:
+            await status_message.edit_text(
+                text,
+                reply_markup=_build_back_markup(job.key_name),
+            )
+        except Exception as e:
+            logger.error(f"[HappTV] Не удалось обновить статус отправки: {e}")
 
-    kb = InlineKeyboardBuilder()
-    kb.row(InlineKeyboardButton(text="🔙 Назад", callback_data=f"happ_tv_cancel|{key_name}"))
 
-    await edit_or_send_message(
-        target_message=message,
-        text=HAPP_TV_SUCCESS if ok else HAPP_TV_ERROR,
-        reply_markup=kb.as_markup(),
-    )
+happ_tv_jobs = HappTVJobQueue(happ_tv_client, _on_send_done)
 
-    await state.clear()
+
+@router.shutdown()
+async def close_happ_tv_client():
+    await happ_tv_jobs.close()
+    await happ_tv_client.close()
 
 
 @router.callback_query(F.data.startswith("happ_tv_cancel|"))
@@ -110,14 +137,9 @@ async def happ_tv_cancel(callback: CallbackQuery, state: FSMContext, session):
     except Exception:
         pass
     key_name = callback.data.split("|")[1]
+    await render_key_info(callback.message, session, key_name, KEY_VIEW_IMAGE)
 
-    import os
-    from handlers.keys.key_view import render_key_info
-
-    image_path = os.path.join("img", "pic_view.jpg")
-    await render_key_info(callback.message, session, key_name, image_path)
-
-register_hook("view_key_menu", view_key_menu_hook)
+register_hook("view_key_menu", view_key_menu_hook, concurrent=True)
 logger.info("[HappTV] Модуль инициализирован, хуки зарегистрированы")
 
 
@@ -0,0 +1,51 @@
+"""
+Настройки модуля Happ TV
+"""
+
+# =============================================================================
+# ПОДКЛЮЧЕНИЕ К API HAPP
+# =============================================================================
+
+# Адрес API (для тестов можно указать локальный сервер-заглушку)
+HAPP_TV_API_URL = "https://check.happ.su"
+
+# Общий дедлайн на отправку кода, включая повторные попытки (секунды)
+HAPP_TV_REQUEST_TIMEOUT = 15
+
+# Таймаут установки соединения (секунды)
+HAPP_TV_CONNECT_TIMEOUT = 5
+
+# Количество повторных попыток при ответах 5xx и сетевых ошибках
+HAPP_TV_RETRIES = 2
+
+# Базовая задержка между попытками (секунды), растет экспоненциально со случайным разбросом
+HAPP_TV_RETRY_BACKOFF = 0.5
+
+# =============================================================================
+# ПУЛ СОЕДИНЕНИЙ
+# =============================================================================
+
+# Максимум одновременных соединений в пуле
+HAPP_TV_MAX_CONNECTIONS = 20
+
+# Максимум одновременных запросов к API
+HAPP_TV_MAX_CONCURRENCY = 10
+
+# Время жизни keep-alive соединения (секунды)
+HAPP_TV_KEEPALIVE_TIMEOUT = 30
+
+# Время кэширования DNS (секунды)
+HAPP_TV_DNS_CACHE_TTL = 300
+
+# =============================================================================
+# ФОНОВАЯ ОТПРАВКА
+# =============================================================================
+
+# Количество фоновых воркеров, отправляющих коды на TV
+HAPP_TV_WORKERS = 4
+
+# Максимальная длина очереди отправок (при переполнении пользователь сразу получает ошибку)
+HAPP_TV_QUEUE_SIZE = 500
+
+# Сколько секунд ждать ввода кода, прежде чем состояние FSM будет удалено
+HAPP_TV_STATE_TTL = 600
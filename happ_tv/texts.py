@@ -31,3 +31,8 @@ HAPP_TV_INVALID_CODE = (
 )
 
 
+
+HAPP_TV_SENDING = (
+    "⏳ <b>Отправляем конфигурацию на ваш телевизор...</b>\n\n"
+    "Это займет несколько секунд, сообщение обновится автоматически."
+)
@@ -0,0 +1,284 @@
+import asyncio
+import functools
+import time
+
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any
+
+from pydantic import BaseModel
+
+from hooks.hooks import register_hook as _register_hook
+from hooks.hooks import run_hooks as _run_hooks_sequential
+from logger import logger
+
+from .metrics import observe_hook
+
+
+HOOK_TIMEOUT = 2.0
+SLOW_HOOK_THRESHOLD = 1.0
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 60.0
+HOOK_CACHE_TTL = 300.0
+HOOK_CACHE_SIZE = 5_000
+
+# Области кэширования результатов хука: общий для всех, по chat_id, по key_name
+CACHE_STATIC = "static"
+CACHE_PER_CHAT = "chat"
+CACHE_PER_KEY = "key"
+_CACHE_KWARGS = {CACHE_STATIC: None, CACHE_PER_CHAT: "chat_id", CACHE_PER_KEY: "key_name"}
+
+HookCallback = Callable[..., Awaitable[Any]]
+
+
+@dataclass(frozen=True, slots=True)
+class HookOptions:
+    # Хук не трогает общую сессию БД и может выполняться параллельно с другими
+    concurrent: bool = False
+    timeout: float | None = None
+    # Хук принимает все вызовы run_hooks_batch разом, аргументом calls
+    batch: bool = False
+
+
+@dataclass(slots=True)
+class _Breaker:
+    failures: int = 0
+    open_until: float = 0.0
+
+
+def _copy_result(result: Any) -> Any:
+    """
+    Копия результата хука, которую можно править: списки и словари пересобираются,
+    кнопки копируются через model_copy(), строки и числа отдаются как есть.
+    Обходится без deepcopy, который дороже самого вызова хука.
+    """
+    if isinstance(result, BaseModel):
+        return result.model_copy()
+    if isinstance(result, dict):
+        return {key: _copy_result(value) for key, value in result.items()}
+    if isinstance(result, (list, tuple)):
+        return [_copy_result(item) for item in result]
+    return result
+
+
+class _CachedHook:
+    """
+    Обертка над хуком, которая отдает запомненный результат вместо повторного вызова.
+    Каждый вызывающий получает свою копию (_copy_result): правка кнопок одним
+    обработчиком не должна попасть в кэш и к другим пользователям. Кэш нужен только
+    хукам, которые ходят в БД или сеть.
+    """
+
+    def __init__(self, func: HookCallback, scope: str, ttl: float, maxsize: int = HOOK_CACHE_SIZE):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.kwarg = _CACHE_KWARGS[scope]
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+
+    async def __call__(self, **kwargs):
+        if self.kwarg is not None and kwargs.get(self.kwarg) is None:
+            return await self.func(**kwargs)
+
+        key = kwargs.get(self.kwarg) if self.kwarg else None
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            self._entries.move_to_end(key)
+            return _copy_result(entry[1])
+
+        result = await self.func(**kwargs)
+        # Хук мог оставить ссылки на свои объекты, поэтому в кэш идет копия
+        self._entries[key] = (now + self.ttl, _copy_result(result))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return result
+
+    def invalidate(self, key: Any = None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+
+class _UpstreamHook:
+    """
+    Представитель хука в реестре hooks.hooks. Если точку вызывает исходный
+    hooks.hooks.run_hooks, хук выполняется с дедлайном, предохранителем и метриками.
+    Внутри run_hooks этого модуля хук уже вызван диспетчером, поэтому здесь пропускается.
+    """
+
+    def __init__(self, name: str, func: HookCallback):
+        functools.update_wrapper(self, func)
+        self.name = name
+        self.func = func
+
+    async def __call__(self, **kwargs):
+        if _dispatching.get():
+            return None
+        if _options.get(self.func, _DEFAULT_OPTIONS).batch:
+            kwargs = {**kwargs, "calls": [kwargs]}
+        return await _call_hook(self.name, self.func, kwargs)
+
+
+_DEFAULT_OPTIONS = HookOptions()
+_options: dict[HookCallback, HookOptions] = {}
+_breakers: dict[tuple[str, HookCallback], _Breaker] = {}
+_cached_hooks: dict[str, list[_CachedHook]] = {}
+# Хуки, зарегистрированные через этот модуль, по точкам в порядке регистрации
+_hooks: dict[str, list[HookCallback]] = {}
+# Выставлен, пока run_hooks добирает хуки, зарегистрированные напрямую в hooks.hooks
+_dispatching: ContextVar[bool] = ContextVar("hook_dispatching", default=False)
+
+
+def register_hook(
+    name: str,
+    func: HookCallback,
+    *,
+    concurrent: bool = False,
+    timeout: float | None = HOOK_TIMEOUT,
+    cache: str | None = None,
+    ttl: float = HOOK_CACHE_TTL,
+    batch: bool = False,
+):
+    """
+    Регистрирует хук с параметрами диспетчеризации. В hooks.hooks попадает его представитель,
+    так что точки, которые вызываются исходным hooks.hooks.run_hooks, тоже видят хук.
+    Хуки, зарегистрированные напрямую через hooks.hooks, выполняются последовательно и без дедлайна.
+
+    cache — область кэширования результата (CACHE_STATIC, CACHE_PER_CHAT, CACHE_PER_KEY),
+    подходит только для хуков, чей результат зависит лишь от chat_id/key_name.
+    batch=True — хук вызывается run_hooks_batch один раз и получает список аргументов
+    всех вызовов в calls, вместо отдельного вызова на каждый.
+    """
+    if cache is not None:
+        func = _CachedHook(func, cache, ttl)
+        _cached_hooks.setdefault(name, []).append(func)
+    _options[func] = HookOptions(concurrent=concurrent, timeout=timeout, batch=batch)
+    _hooks.setdefault(name, []).append(func)
+    _register_hook(name, _UpstreamHook(name, func))
+
+
+def invalidate_hook_cache(name: str | None = None, func: HookCallback | None = None, key: Any = None):
+    """Сбрасывает кэш результатов хуков: всех, по имени точки, по функции и/или по ключу (chat_id/key_name)."""
+    for hook_name, cached_hooks in _cached_hooks.items():
+        if name is not None and hook_name != name:
+            continue
+        for cached in cached_hooks:
+            if func is None or cached.func is func:
+                cached.invalidate(key)
+
+
+async def _run_direct_hooks(name: str, **kwargs) -> list:
+    """Хуки точки name, зарегистрированные напрямую в hooks.hooks, через исходный run_hooks."""
+    token = _dispatching.set(True)
+    try:
+        results = await _run_hooks_sequential(name, **kwargs)
+    finally:
+        _dispatching.reset(token)
+    return [result for result in results if result is not None]
+
+
+def _record_failure(name: str, func: HookCallback, breaker: _Breaker, reason: str):
+    breaker.failures += 1
+    if breaker.failures >= BREAKER_FAILURES:
+        breaker.open_until = time.monotonic() + BREAKER_COOLDOWN
+        breaker.failures = 0
+        logger.warning(
+            f"[Hooks:{name}] {func.__qualname__} отключен на {BREAKER_COOLDOWN:.0f}с после {BREAKER_FAILURES} сбоев ({reason})"
+        )
+
+
+async def _call_hook(name: str, func: HookCallback, kwargs: dict) -> Any:
+    breaker = _breakers.setdefault((name, func), _Breaker())
+    started = time.monotonic()
+    if breaker.open_until > started:
+        return None
+
+    options = _options.get(func, _DEFAULT_OPTIONS)
+    try:
+        if options.timeout:
+            result = await asyncio.wait_for(func(**kwargs), options.timeout)
+        else:
+            result = await func(**kwargs)
+    except asyncio.TimeoutError:
+        observe_hook(name, time.monotonic() - started)
+        logger.error(f"[Hooks:{name}] {func.__qualname__} превысил дедлайн {options.timeout}с")
+        _record_failure(name, func, breaker, "timeout")
+        return None
+    except Exception as e:
+        observe_hook(name, time.monotonic() - started)
+        logger.error(f"[Hooks:{name}] Ошибка в {func.__qualname__}: {e}")
+        _record_failure(name, func, breaker, "error")
+        return None
+
+    elapsed = time.monotonic() - started
+    observe_hook(name, elapsed)
+    if elapsed > SLOW_HOOK_THRESHOLD:
+        logger.warning(f"[Hooks:{name}] {func.__qualname__} выполнялся {elapsed:.2f}с")
+        _record_failure(name, func, breaker, "slow")
+    else:
+        breaker.failures = 0
+    return result
+
+
+async def _dispatch(name: str, calls: list[tuple[HookCallback, dict]]) -> list:
+    results: list[Any] = [None] * len(calls)
+    concurrent = [
+        (i, asyncio.ensure_future(_call_hook(name, func, kwargs)))
+        for i, (func, kwargs) in enumerate(calls)
+        if _options.get(func, _DEFAULT_OPTIONS).concurrent
+    ]
+    concurrent_indexes = {i for i, _ in concurrent}
+
+    try:
+        for i, (func, kwargs) in enumerate(calls):
+            if i not in concurrent_indexes:
+                results[i] = await _call_hook(name, func, kwargs)
+
+        if concurrent:
+            for (i, _), result in zip(concurrent, await asyncio.gather(*(task for _, task in concurrent))):
+                results[i] = result
+    finally:
+        # При отмене обработчика параллельные хуки не должны остаться висеть без владельца
+        pending = [task for _, task in concurrent if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    return [result for result in results if result is not None]
+
+
+async def run_hooks(name: str, **kwargs) -> list:
+    """
+    Вызывает хуки с изоляцией ошибок и дедлайнами. Хуки с concurrent=True запускаются
+    одновременно через asyncio.gather, остальные — по очереди; порядок результатов
+    совпадает с порядком регистрации, None-результаты отбрасываются. Результаты хуков,
+    зарегистрированных напрямую в hooks.hooks, идут следом.
+    """
+    results = await _dispatch(name, [(func, kwargs) for func in _hooks.get(name, ())])
+    results.extend(await _run_direct_hooks(name, **kwargs))
+    return results
+
+
+async def run_hooks_batch(name: str, calls: list[dict], **common) -> list:
+    """
+    Вызывает хуки точки для набора аргументов (например, для всех частей deep-link).
+    Хук с batch=True вызывается один раз с common и calls, остальные — на каждый вызов
+    с common и его аргументами. Параллельные хуки выполняются одним asyncio.gather.
+    """
+    entries = []
+    for func in _hooks.get(name, ()):
+        if _options.get(func, _DEFAULT_OPTIONS).batch:
+            entries.append((func, {**common, "calls": calls}))
+        else:
+            entries.extend((func, {**common, **call}) for call in calls)
+    results = await _dispatch(name, entries)
+    for call in calls:
+        results.extend(await _run_direct_hooks(name, **common, **call))
+    return results
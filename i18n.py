@@ -0,0 +1,135 @@
+import importlib
+import json
+import os
+import sys
+
+from contextvars import ContextVar
+from typing import Any
+
+from aiogram import BaseMiddleware
+
+from logger import logger
+
+
+DEFAULT_LOCALE = "ru"
+# language_code от клиентов Telegram — небольшое множество, но кэш все равно ограничен
+RESOLVED_LOCALES_SIZE = 256
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+
+current_locale: ContextVar[str] = ContextVar("current_locale", default=DEFAULT_LOCALE)
+
+
+class MessageCatalog:
+    """
+    Каталог текстов по id сообщения и локали.
+
+    Базовая локаль (ru) — это строковые константы модулей texts, зарегистрированных
+    через register_namespace. Остальные локали лежат в locales/<locale>/<namespace>.json
+    и загружаются только при первом обращении к паре (локаль, namespace). Отсутствующие
+    переводы берутся из базовой локали.
+    """
+
+    def __init__(self, default_locale: str = DEFAULT_LOCALE, locales_dir: str = LOCALES_DIR):
+        self.default_locale = default_locale
+        self.locales_dir = locales_dir
+        self._namespaces: dict[str, str] = {}
+        self._tables: dict[tuple[str, str], dict[str, str]] = {}
+        self._available: frozenset[str] | None = None
+        self._resolved: dict[str | None, str] = {}
+
+    def register_namespace(self, namespace: str, module_path: str):
+        self._namespaces[namespace] = module_path
+
+    def invalidate(self, namespace: str | None = None):
+        """Сбрасывает загруженные тексты (например, после перезагрузки модуля texts)."""
+        if namespace is None:
+            self._tables.clear()
+            self._available = None
+            self._resolved.clear()
+        else:
+            for key in [key for key in self._tables if key[1] == namespace]:
+                del self._tables[key]
+
+    def available_locales(self) -> frozenset[str]:
+        if self._available is None:
+            try:
+                found = {entry.name for entry in os.scandir(self.locales_dir) if entry.is_dir()}
+            except FileNotFoundError:
+                found = set()
+            self._available = frozenset(found | {self.default_locale})
+        return self._available
+
+    def _load(self, locale: str, namespace: str) -> dict[str, str]:
+        if locale == self.default_locale:
+            module = importlib.import_module(self._namespaces[namespace])
+            return {
+                sys.intern(name): value
+                for name, value in vars(module).items()
+                if name.isupper() and isinstance(value, str)
+            }
+
+        path = os.path.join(self.locales_dir, locale, f"{namespace}.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"[i18n] Не удалось загрузить {path}: {e}")
+            return {}
+        return {sys.intern(name): sys.intern(value) for name, value in raw.items()}
+
+    def _table(self, locale: str, namespace: str) -> dict[str, str]:
+        table = self._tables.get((locale, namespace))
+        if table is None:
+            table = self._tables[(locale, namespace)] = self._load(locale, namespace)
+        return table
+
+    def get(self, msg_id: str, locale: str | None = None, namespace: str = "core") -> str:
+        locale = locale or current_locale.get()
+        if locale != self.default_locale:
+            text = self._table(locale, namespace).get(msg_id)
+            if text is not None:
+                return text
+        return self._table(self.default_locale, namespace)[msg_id]
+
+    def resolve_locale(self, language_code: str | None) -> str:
+        locale = self._resolved.get(language_code)
+        if locale is None:
+            if len(self._resolved) >= RESOLVED_LOCALES_SIZE:
+                self._resolved.clear()
+            locale = self._resolved[language_code] = self._resolve_locale(language_code)
+        return locale
+
+    def _resolve_locale(self, language_code: str | None) -> str:
+        if not language_code:
+            return self.default_locale
+        available = self.available_locales()
+        language_code = language_code.lower().replace("_", "-")
+        if language_code in available:
+            return language_code
+        base = language_code.split("-", 1)[0]
+        return base if base in available else self.default_locale
+
+
+catalog = MessageCatalog()
+catalog.register_namespace("core", "handlers.texts")
+
+
+def t(msg_id: str, namespace: str = "core") -> str:
+    """Текст сообщения в локали текущего апдейта."""
+    return catalog.get(msg_id, namespace=namespace)
+
+
+class LocaleMiddleware(BaseMiddleware):
+    """Определяет локаль пользователя один раз на апдейт и кладет ее в current_locale и data["locale"]."""
+
+    async def __call__(self, handler, event, data: dict[str, Any]):
+        user = data.get("event_from_user")
+        locale = catalog.resolve_locale(user.language_code if user else None)
+        data["locale"] = locale
+        token = current_locale.set(locale)
+        try:
+            return await handler(event, data)
+        finally:
+            current_locale.reset(token)
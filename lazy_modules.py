@@ -0,0 +1,162 @@
+import asyncio
+import importlib
+import time
+
+from dataclasses import dataclass
+from typing import Any
+
+from aiogram import BaseMiddleware, Router
+
+from logger import logger
+
+
+# Пауза перед фоновой догрузкой, чтобы не мешать первым апдейтам после старта
+LAZY_PRELOAD_DELAY = 5.0
+
+# Время загрузки отложенных модулей, сек: для отчета о холодном старте
+load_times: dict[str, float] = {}
+
+
+def _import(module_path: str):
+    started = time.perf_counter()
+    module = importlib.import_module(module_path)
+    load_times.setdefault(module_path, time.perf_counter() - started)
+    return module
+
+
+class LazyObject:
+    """
+    Объект из модуля, который импортируется при первом обращении, а не при импорте
+    вызывающего кода. После первого вызова работает как обычная ссылка на объект.
+    """
+
+    __slots__ = ("module_path", "attr", "_target")
+
+    def __init__(self, module_path: str, attr: str):
+        self.module_path = module_path
+        self.attr = attr
+        self._target = None
+
+    def resolve(self) -> Any:
+        if self._target is None:
+            self._target = getattr(_import(self.module_path), self.attr)
+        return self._target
+
+    def __call__(self, *args, **kwargs):
+        return (self._target or self.resolve())(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"<lazy {self.module_path}.{self.attr}>"
+
+
+_lazy_objects: list[LazyObject] = []
+
+
+def lazy(module_path: str, attr: str) -> Any:
+    obj = LazyObject(module_path, attr)
+    _lazy_objects.append(obj)
+    return obj
+
+
+async def preload(delay: float = LAZY_PRELOAD_DELAY):
+    """
+    Догружает все отложенные объекты после старта, по одному модулю за итерацию цикла,
+    чтобы первый пользователь не платил за импорт.
+    """
+    await asyncio.sleep(delay)
+    for obj in _lazy_objects:
+        try:
+            obj.resolve()
+        except Exception as e:
+            logger.error(f"[Lazy] Не удалось загрузить {obj!r}: {e}")
+        await asyncio.sleep(0)
+
+
+@dataclass(frozen=True, slots=True)
+class ModuleSpec:
+    name: str
+    # Модуль с атрибутом router
+    import_path: str
+    # Префиксы callback_data и команды, по которым модуль загружается
+    callback_prefixes: tuple[str, ...] = ()
+    commands: tuple[str, ...] = ()
+    # Модули, регистрирующие хуки, нужно грузить сразу: их кнопки появляются через хуки
+    eager: bool = False
+
+
+class ModuleRegistry:
+    """
+    Реестр роутеров модулей. Eager-модули подключаются при register(), остальные —
+    при первом апдейте, который им адресован (по префиксу callback_data или команде):
+    outer-middleware роутера реестра подключает нужный роутер до того, как aiogram
+    начнет обход вложенных роутеров. Startup-хуки роутера, подключенного после старта
+    бота, вызываются при подключении с данными этого апдейта; shutdown-хуки срабатывают
+    обычным порядком, так как роутер к тому времени уже в дереве.
+    """
+
+    def __init__(self, name: str = "module_registry"):
+        self.router = Router(name=name)
+        self._specs: dict[str, ModuleSpec] = {}
+        self._loaded: set[str] = set()
+        middleware = _LazyRouterMiddleware(self)
+        self.router.message.outer_middleware(middleware)
+        self.router.callback_query.outer_middleware(middleware)
+
+    def register(self, spec: ModuleSpec):
+        self._specs[spec.name] = spec
+        if spec.eager:
+            self.load(spec.name)
+
+    def load(self, name: str) -> Router:
+        spec = self._specs[name]
+        module = _import(spec.import_path)
+        if name not in self._loaded:
+            self.router.include_router(module.router)
+            self._loaded.add(name)
+            logger.info(f"[Modules] Модуль {name} загружен за {load_times[spec.import_path] * 1000:.0f} мс")
+        return module.router
+
+    async def load_on_demand(self, name: str, data: dict[str, Any]):
+        if name in self._loaded:
+            return
+        router = self.load(name)
+        await router.emit_startup(**data)
+
+    def load_all(self):
+        for name in self._specs:
+            self.load(name)
+
+    def _match(self, event: Any) -> list[str]:
+        data = getattr(event, "data", None)
+        text = getattr(event, "text", None)
+        command = text.split(maxsplit=1)[0].lstrip("/").split("@", 1)[0] if text and text.startswith("/") else None
+        return [
+            spec.name
+            for spec in self._specs.values()
+            if spec.name not in self._loaded
+            and (
+                (data is not None and data.startswith(spec.callback_prefixes))
+                or (command is not None and command in spec.commands)
+            )
+        ]
+
+    @property
+    def pending(self) -> bool:
+        return len(self._loaded) < len(self._specs)
+
+
+class _LazyRouterMiddleware(BaseMiddleware):
+    def __init__(self, registry: ModuleRegistry):
+        self.registry = registry
+
+    async def __call__(self, handler, event, data: dict[str, Any]):
+        if self.registry.pending:
+            for name in self.registry._match(event):
+                try:
+                    await self.registry.load_on_demand(name, data)
+                except Exception as e:
+                    logger.error(f"[Modules] Не удалось загрузить модуль {name}: {e}")
+        return await handler(event, data)
+
+
+module_registry = ModuleRegistry()
@@ -1,37 +1,71 @@
 from aiogram import Router, F
-from aiogram.types import CallbackQuery, InlineKeyboardButton, WebAppInfo
-from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 import re
+from functools import cache
 
-# Импорты для логирования (если hooks недоступны)
+# Импорты для логирования (если логгер бота недоступен)
 try:
-    from hooks.hooks import register_hook
     from logger import logger
-    HOOKS_AVAILABLE = True
 except ImportError:
-    HOOKS_AVAILABLE = False
     import logging
     logger = logging.getLogger(__name__)
 
+try:
+    from handlers.hook_dispatch import register_hook
+    HOOKS_AVAILABLE = True
+except ImportError as e:
+    HOOKS_AVAILABLE = False
+    logger.error(f"[LegalDocs] Не удалось импортировать диспетчер хуков, кнопки в 'О сервисе' не появятся: {e}")
+
+try:
+    from handlers.i18n import LocaleMiddleware, catalog
+    I18N_AVAILABLE = True
+except ImportError:
+    I18N_AVAILABLE = False
+
+try:
+    from handlers.metrics import HandlerMetricsMiddleware
+    METRICS_AVAILABLE = True
+except ImportError:
+    METRICS_AVAILABLE = False
+
 
 router = Router(name="legal_docs_module")
 
+if I18N_AVAILABLE:
+    router.callback_query.middleware(LocaleMiddleware())
+    catalog.register_namespace("legal_docs", f"{__package__}.texts")
+if METRICS_AVAILABLE:
+    router.callback_query.middleware(HandlerMetricsMiddleware())
+
+
+def _text(msg_id: str) -> str:
+    """Текст в локали пользователя (или из texts.py, если каталог недоступен)"""
+    if I18N_AVAILABLE:
+        return catalog.get(msg_id, namespace="legal_docs")
+    from . import texts
+    return getattr(texts, msg_id)
+
+
+# Регулярное выражение для проверки HTTP/HTTPS URL (компилируется один раз)
+_URL_PATTERN = re.compile(
+    r'^https?://'  # http:// или https://
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # домен
+    r'localhost|'  # localhost
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # IP адрес
+    r'(?::\d+)?'  # порт
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+
+# Кнопки собираются при импорте и при вызове reload_settings(), а не на каждый клик
+_DOC_BUTTONS: tuple[InlineKeyboardButton, ...] = ()
+_HOOK_BUTTONS: tuple[dict, ...] = ()
+
 
 def _validate_url(url: str) -> bool:
     """Проверяет, является ли URL валидным HTTP/HTTPS адресом"""
     if not url:
         return False
-    
-    # Регулярное выражение для проверки HTTP/HTTPS URL
-    url_pattern = re.compile(
-        r'^https?://'  # http:// или https://
-        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # домен
-        r'localhost|'  # localhost
-        r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # IP адрес
-        r'(?::\d+)?'  # порт
-        r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-    
-    return bool(url_pattern.match(url))
+    return bool(_URL_PATTERN.match(url))
 
 
 def _build_menu_button() -> InlineKeyboardButton:
@@ -40,12 +74,36 @@ def _build_menu_button() -> InlineKeyboardButton:
     return InlineKeyboardButton(text=LEGAL_MENU_BUTTON_TEXT, callback_data="legal_docs_menu")
 
 
-def _build_direct_buttons() -> list[InlineKeyboardButton]:
-    """Создает кнопки для прямого доступа к документам"""
+@cache
+def _back_row() -> tuple[InlineKeyboardButton, ...]:
+    """Строка с кнопкой возврата в раздел "О сервисе" (собирается один раз, не изменяется)"""
+    from handlers.buttons import BACK
+    return (InlineKeyboardButton(text=BACK, callback_data="about_vpn"),)
+
+
+def _copy_row(row) -> list[InlineKeyboardButton]:
+    """Копия строки кнопок для новой клавиатуры: общий набор остается неизменным"""
+    return [button.model_copy() for button in row]
+
+
+def _back_markup() -> InlineKeyboardMarkup:
+    """Клавиатура из одной кнопки "Назад" для сообщений об ошибках"""
+    return InlineKeyboardMarkup(inline_keyboard=[_copy_row(_back_row())])
+
+
+def _menu_markup() -> InlineKeyboardMarkup:
+    """Клавиатура подменю документов с кнопкой "Назад" """
+    return InlineKeyboardMarkup(
+        inline_keyboard=[_copy_row((button,)) for button in _DOC_BUTTONS] + [_copy_row(_back_row())]
+    )
+
+
+def _build_direct_buttons() -> tuple[InlineKeyboardButton, ...]:
+    """Создает кнопки для прямого доступа к документам, невалидные URL пишутся в лог"""
     from .texts import LEGAL_DOCS_BUTTON
-    
+
     buttons = []
-    
+
     # Все документы из единого массива
     for doc in LEGAL_DOCS_BUTTON:
         if _validate_url(doc.get("url", "")):
@@ -55,43 +113,69 @@ def _build_direct_buttons() -> list[InlineKeyboardButton]:
             ))
         else:
             logger.error(f"[LegalDocs] Невалидный URL для документа '{doc.get('text', 'Unknown')}': {doc.get('url', '')}")
-    
-    return buttons
 
+    return tuple(buttons)
 
-async def about_vpn_hook(**kwargs):
+
+def _build_hook_buttons() -> tuple[dict, ...]:
+    """Собирает набор кнопок, который хук отдает в раздел 'О сервисе'"""
+    from .settings import LEGAL_DOCS_ENABLED, DISPLAY_MODE, DIRECT_LAYOUT
+
+    if not LEGAL_DOCS_ENABLED:
+        return ()
+
+    if DISPLAY_MODE == "menu":
+        # Режим меню - одна кнопка ведущая в подменю
+        return ({"button": _build_menu_button()},)
+
+    if DISPLAY_MODE == "direct":
+        # Прямой режим - кнопки документов сразу в разделе "О сервисе"
+        if DIRECT_LAYOUT == "same_row":
+            # Все кнопки на одной строке
+            return ({"buttons": _DOC_BUTTONS},)
+        # separate_rows - каждая кнопка на отдельной строке
+        return tuple({"button": button} for button in _DOC_BUTTONS)
+
+    return ()
+
+
+def reload_settings():
     """
-    Хук для добавления кнопок юридических документов в раздел 'О сервисе'
+    Перечитывает settings.py и texts.py модуля и пересобирает кнопки.
+    Ошибки валидации URL логируются здесь, один раз на каждую загрузку настроек.
     """
+    import importlib
+    from . import settings, texts
+
+    importlib.reload(settings)
+    importlib.reload(texts)
+    _load_buttons()
+    if I18N_AVAILABLE:
+        catalog.invalidate("legal_docs")
+
+
+def _load_buttons():
+    global _DOC_BUTTONS, _HOOK_BUTTONS
     try:
-        from .settings import LEGAL_DOCS_ENABLED, DISPLAY_MODE, DIRECT_LAYOUT
-        
-        if not LEGAL_DOCS_ENABLED:
-            return None
-            
-        buttons_to_add = []
-        
-        if DISPLAY_MODE == "menu":
-            # Режим меню - одна кнопка ведущая в подменю
-            buttons_to_add.append({"button": _build_menu_button()})
-            
-        elif DISPLAY_MODE == "direct":
-            # Прямой режим - кнопки документов сразу в разделе "О сервисе"
-            direct_buttons = _build_direct_buttons()
-            
-            if DIRECT_LAYOUT == "same_row":
-                # Все кнопки на одной строке
-                buttons_to_add.append({"buttons": direct_buttons})
-            else:  # separate_rows
-                # Каждая кнопка на отдельной строке
-                for button in direct_buttons:
-                    buttons_to_add.append({"button": button})
-        
-        return buttons_to_add
-        
+        _DOC_BUTTONS = _build_direct_buttons()
+        _HOOK_BUTTONS = _build_hook_buttons()
     except Exception as e:
         logger.error(f"[LegalDocs] Ошибка построения кнопок: {e}")
+        _DOC_BUTTONS, _HOOK_BUTTONS = (), ()
+
+
+async def about_vpn_hook(**kwargs):
+    """
+    Хук для добавления кнопок юридических документов в раздел 'О сервисе'
+    """
+    if not _HOOK_BUTTONS:
         return None
+    # Кнопки собраны заранее, поэтому кэш хука не нужен; отдаем поверхностные копии кнопок,
+    # чтобы вставка в клавиатуру не могла изменить общий набор
+    return [
+        {"buttons": _copy_row(entry["buttons"])} if "buttons" in entry else {"button": entry["button"].model_copy()}
+        for entry in _HOOK_BUTTONS
+    ]
 
 
 @router.callback_query(F.data == "legal_docs_menu")
@@ -99,62 +183,39 @@ async def show_legal_docs_menu(callback: CallbackQuery):
     """Показывает меню юридических документов с кнопками для WebApp"""
     try:
         from .settings import LEGAL_DOCS_ENABLED
-        from .texts import LEGAL_DOCS_MENU_TEXT, LEGAL_DOCS_BUTTON, ERROR_MODULE_DISABLED, ERROR_NO_DOCUMENTS
-        from handlers.buttons import BACK
         from handlers.utils import edit_or_send_message
         
         # Проверяем, включен ли модуль
         if not LEGAL_DOCS_ENABLED:
             await edit_or_send_message(
                 target_message=callback.message,
-                text=ERROR_MODULE_DISABLED,
-                reply_markup=InlineKeyboardBuilder().row(
-                    InlineKeyboardButton(text=BACK, callback_data="about_vpn")
-                ).as_markup(),
+                text=_text("ERROR_MODULE_DISABLED"),
+                reply_markup=_back_markup(),
             )
             return
         
-        kb = InlineKeyboardBuilder()
-        
-        # Все документы из единого массива
-        for doc in LEGAL_DOCS_BUTTON:
-            if _validate_url(doc.get("url", "")):
-                kb.row(
-                    InlineKeyboardButton(
-                        text=doc["text"],
-                        web_app=WebAppInfo(url=doc["url"])
-                    )
-                )
-            else:
-                logger.error(f"[LegalDocs] Невалидный URL для документа '{doc.get('text', 'Unknown')}': {doc.get('url', '')}")
-        
-        # Кнопка "Назад" в раздел "О сервисе"
-        kb.row(InlineKeyboardButton(text=BACK, callback_data="about_vpn"))
-        
         await edit_or_send_message(
             target_message=callback.message,
-            text=LEGAL_DOCS_MENU_TEXT,
-            reply_markup=kb.as_markup(),
+            text=_text("LEGAL_DOCS_MENU_TEXT"),
+            reply_markup=_menu_markup(),
         )
         
     except Exception as e:
         logger.error(f"[LegalDocs] Ошибка отображения меню: {e}")
-        from .texts import ERROR_NO_DOCUMENTS
-        from handlers.buttons import BACK
-        
-        kb = InlineKeyboardBuilder()
-        kb.row(InlineKeyboardButton(text=BACK, callback_data="about_vpn"))
-        
+        from handlers.utils import edit_or_send_message
+
         await edit_or_send_message(
             target_message=callback.message,
-            text=ERROR_NO_DOCUMENTS,
-            reply_markup=kb.as_markup(),
+            text=_text("ERROR_NO_DOCUMENTS"),
+            reply_markup=_back_markup(),
         )
 
 
+_load_buttons()
+
 # Регистрируем хук для раздела "О сервисе" (если система хуков доступна)
 if HOOKS_AVAILABLE:
-    register_hook("about_vpn", about_vpn_hook)
+    register_hook("about_vpn", about_vpn_hook, concurrent=True)
     logger.info("[LegalDocs] Модуль инициализирован, хуки зарегистрированы")
 else:
     logger.warning("[LegalDocs] Система хуков недоступна, модуль инициализирован без хуков")
\ No newline at end of file
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import time
+import uuid
+
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Protocol
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from logger import logger
+
+
+LOCK_TTL = 60.0
+
+
+class LockBackend(Protocol):
+    async def acquire(self, key: str, ttl: float) -> str | None: ...
+
+    async def release(self, key: str, token: str) -> None: ...
+
+
+class MemoryLockBackend:
+    """Блокировки в памяти процесса. Подходит только для одного воркера."""
+
+    def __init__(self):
+        self._locks: dict[str, tuple[str, float]] = {}
+
+    async def acquire(self, key: str, ttl: float) -> str | None:
+        now = time.monotonic()
+        current = self._locks.get(key)
+        if current is not None and current[1] > now:
+            return None
+        token = uuid.uuid4().hex
+        self._locks[key] = (token, now + ttl)
+        return token
+
+    async def release(self, key: str, token: str) -> None:
+        current = self._locks.get(key)
+        if current is not None and current[0] == token:
+            del self._locks[key]
+
+
+class RedisLockBackend:
+    """Блокировки на Redis-совместимом сервере: SET NX PX и снятие только своим токеном."""
+
+    _RELEASE_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(self, redis, prefix: str = "lock:"):
+        self.redis = redis
+        self.prefix = prefix
+
+    async def acquire(self, key: str, ttl: float) -> str | None:
+        token = uuid.uuid4().hex
+        acquired = await self.redis.set(f"{self.prefix}{key}", token, nx=True, px=int(ttl * 1000))
+        return token if acquired else None
+
+    async def release(self, key: str, token: str) -> None:
+        await self.redis.eval(self._RELEASE_SCRIPT, 1, f"{self.prefix}{key}", token)
+
+
+class AdvisoryLockBackend:
+    """
+    Блокировки через pg_try_advisory_lock. Блокировка держится на отдельном соединении
+    и снимается при release, по истечении TTL или при обрыве соединения.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self._held: dict[str, tuple[AsyncConnection, asyncio.TimerHandle]] = {}
+
+    @staticmethod
+    def _lock_id(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big", signed=True)
+
+    async def acquire(self, key: str, ttl: float) -> str | None:
+        conn = await self.engine.connect()
+        try:
+            acquired = await conn.scalar(text("SELECT pg_try_advisory_lock(:id)"), {"id": self._lock_id(key)})
+        except BaseException:
+            # Блокировка могла быть взята на сервере до ошибки или отмены
+            await self._discard(conn)
+            raise
+        if not acquired:
+            await conn.close()
+            return None
+
+        token = uuid.uuid4().hex
+        timer = asyncio.get_running_loop().call_later(ttl, lambda: asyncio.create_task(self.release(key, token)))
+        self._held[token] = (conn, timer)
+        return token
+
+    async def release(self, key: str, token: str) -> None:
+        held = self._held.pop(token, None)
+        if held is None:
+            return
+        conn, timer = held
+        timer.cancel()
+        try:
+            await conn.scalar(text("SELECT pg_advisory_unlock(:id)"), {"id": self._lock_id(key)})
+        except BaseException:
+            await self._discard(conn)
+            raise
+        await conn.close()
+
+    @staticmethod
+    async def _discard(conn: AsyncConnection):
+        """
+        Закрывает соединение, не возвращая его в пул: advisory-блокировка живет, пока живет
+        сессия PostgreSQL, и соединение из пула продолжало бы ее держать.
+        """
+        try:
+            await conn.invalidate()
+        finally:
+            await conn.close()
+
+
+_backend: LockBackend = MemoryLockBackend()
+
+
+def set_lock_backend(backend: LockBackend):
+    global _backend
+    _backend = backend
+
+
+@asynccontextmanager
+async def lease(key: str, ttl: float = LOCK_TTL) -> AsyncIterator[bool]:
+    """Пытается захватить блокировку без ожидания; в блок передается, удалось ли это."""
+    token = await _backend.acquire(key, ttl)
+    try:
+        yield token is not None
+    finally:
+        if token is not None:
+            try:
+                await _backend.release(key, token)
+            except Exception as e:
+                logger.error(f"[Locks] Не удалось снять блокировку {key}: {e}")
@@ -0,0 +1,158 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputMediaPhoto, Message
+
+from logger import logger
+
+from .utils import edit_or_send_message
+
+
+MEDIA_CACHE_FILE = os.path.join("img", ".file_ids.json")
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaCache:
+    """
+    Кэш file_id загруженных в Telegram изображений.
+
+    Запись хранит mtime, размер и sha256 файла: пока файл не изменился, повторная
+    отправка идёт по file_id без чтения с диска. Кэш сохраняется в JSON-файл и
+    перечитывается при изменении файла, поэтому переживает рестарт и общий для
+    всех воркеров бота.
+    """
+
+    def __init__(self, cache_file: str = MEDIA_CACHE_FILE):
+        self.cache_file = cache_file
+        self._entries: dict[str, dict] = {}
+        self._loaded_mtime: float | None = None
+
+    def _key(self, bot_id: int, path: str) -> str:
+        return f"{bot_id}:{os.path.normpath(path)}"
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.cache_file).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        try:
+            with open(self.cache_file, encoding="utf-8") as f:
+                self._entries = json.load(f)
+            self._loaded_mtime = mtime
+        except (OSError, ValueError) as e:
+            logger.error(f"[MediaCache] Не удалось прочитать кэш {self.cache_file}: {e}")
+
+    def _persist(self, key: str, entry: dict | None):
+        directory = os.path.dirname(self.cache_file) or "."
+        os.makedirs(directory, exist_ok=True)
+        lock_path = f"{self.cache_file}.lock"
+        try:
+            with open(lock_path, "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                # Перечитываем под блокировкой, чтобы не затереть записи других воркеров
+                self._loaded_mtime = None
+                self._reload()
+                if entry is None:
+                    self._entries.pop(key, None)
+                else:
+                    self._entries[key] = entry
+                tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f, ensure_ascii=False)
+                os.replace(tmp_path, self.cache_file)
+                self._loaded_mtime = os.stat(self.cache_file).st_mtime
+        except OSError as e:
+            logger.error(f"[MediaCache] Не удалось сохранить кэш {self.cache_file}: {e}")
+
+    def get(self, bot_id: int, path: str) -> str | None:
+        self._reload()
+        key = self._key(bot_id, path)
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        if stat.st_mtime_ns == entry["mtime"] and stat.st_size == entry["size"]:
+            return entry["file_id"]
+
+        # mtime изменился — файл могли просто перезаписать тем же содержимым
+        if stat.st_size == entry["size"] and _file_sha256(path) == entry["sha256"]:
+            self._persist(key, {**entry, "mtime": stat.st_mtime_ns})
+            return entry["file_id"]
+
+        self._persist(key, None)
+        return None
+
+    def set(self, bot_id: int, path: str, file_id: str):
+        stat = os.stat(path)
+        entry = {"file_id": file_id, "mtime": stat.st_mtime_ns, "size": stat.st_size, "sha256": _file_sha256(path)}
+        key = self._key(bot_id, path)
+        if self._entries.get(key) == entry:
+            return
+        self._persist(key, entry)
+
+    def forget(self, bot_id: int, path: str):
+        self._persist(self._key(bot_id, path), None)
+
+
+media_cache = MediaCache()
+
+
+async def edit_or_send_cached_photo(
+    target_message: Message,
+    text: str,
+    media_path: str,
+    reply_markup=None,
+    force_text: bool = False,
+):
+    if force_text or not os.path.isfile(media_path):
+        await edit_or_send_message(
+            target_message, text, reply_markup=reply_markup, media_path=media_path, force_text=force_text
+        )
+        return
+
+    from_bot = bool(target_message.from_user and target_message.from_user.is_bot)
+    if from_bot and not target_message.photo:
+        # Сообщение бота без фото редактируется так же, как раньше, через edit_or_send_message
+        await edit_or_send_message(target_message, text, reply_markup=reply_markup, media_path=media_path)
+        return
+
+    bot = target_message.bot
+    # stat, sha256 и JSON-файл кэша с flock — блокирующие операции, выполняются вне event loop
+    file_id = await asyncio.to_thread(media_cache.get, bot.id, media_path)
+    media = file_id or FSInputFile(media_path)
+
+    try:
+        if from_bot:
+            sent = await target_message.edit_media(
+                media=InputMediaPhoto(media=media, caption=text), reply_markup=reply_markup
+            )
+        else:
+            sent = await target_message.answer_photo(photo=media, caption=text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if "message is not modified" in str(e):
+            return
+        if file_id:
+            await asyncio.to_thread(media_cache.forget, bot.id, media_path)
+        logger.warning(f"[MediaCache] Отправка {media_path} по кэшу не удалась: {e}")
+        await edit_or_send_message(target_message, text, reply_markup=reply_markup, media_path=media_path)
+        return
+
+    if not file_id and isinstance(sent, Message) and sent.photo:
+        await asyncio.to_thread(media_cache.set, bot.id, media_path, sent.photo[-1].file_id)
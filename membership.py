@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+from collections import OrderedDict
+
+from aiogram import Bot
+from aiogram.types import Chat
+
+from bot import bot
+from config import CHANNEL_ID
+
+
+MEMBERSHIP_POSITIVE_TTL = 60.0
+MEMBERSHIP_NEGATIVE_TTL = 5.0
+MEMBERSHIP_CACHE_SIZE = 100_000
+# Запросов getChatMember в секунду на процесс
+MEMBERSHIP_FETCH_RATE = 20.0
+
+MEMBER_STATUSES = frozenset({"member", "administrator", "creator"})
+
+
+class ChannelMembershipCache:
+    """
+    Кэш подписки пользователей на канал. Подписка кэшируется надолго, отсутствие
+    подписки — на несколько секунд, чтобы нажатие «Я подписался» сразу после
+    подписки проверялось заново. Если бот админ канала, кэш обновляется из
+    chat_member апдейтов. Одновременные проверки одного пользователя склеиваются
+    в один запрос, запросы к API ограничены по частоте.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        chat_id: int | str,
+        positive_ttl: float = MEMBERSHIP_POSITIVE_TTL,
+        negative_ttl: float = MEMBERSHIP_NEGATIVE_TTL,
+        maxsize: int = MEMBERSHIP_CACHE_SIZE,
+        fetch_rate: float = MEMBERSHIP_FETCH_RATE,
+    ):
+        self.bot = bot
+        self.chat_id = chat_id
+        # CHANNEL_ID в конфиге может быть числом, строкой с числом или @username
+        self._channel_id: int | None = None
+        self._channel_username: str | None = None
+        if isinstance(chat_id, int) or str(chat_id).lstrip("-").isdigit():
+            self._channel_id = int(chat_id)
+        else:
+            self._channel_username = str(chat_id).lstrip("@").lower()
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self.fetch_interval = 1.0 / fetch_rate
+        self._entries: OrderedDict[int, tuple[float, bool]] = OrderedDict()
+        self._inflight: dict[int, asyncio.Future] = {}
+        self._next_fetch_at = 0.0
+
+    def _store(self, user_id: int, is_member: bool):
+        ttl = self.positive_ttl if is_member else self.negative_ttl
+        self._entries[user_id] = (time.monotonic() + ttl, is_member)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def is_channel(self, chat: Chat) -> bool:
+        if self._channel_id is not None:
+            return chat.id == self._channel_id
+        return chat.username is not None and chat.username.lower() == self._channel_username
+
+    def update(self, user_id: int, status: str):
+        self._store(user_id, status in MEMBER_STATUSES)
+
+    async def _throttle(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_fetch_at)
+        self._next_fetch_at = slot + self.fetch_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _fetch(self, user_id: int) -> bool:
+        try:
+            await self._throttle()
+            member = await self.bot.get_chat_member(self.chat_id, user_id)
+            is_member = member.status in MEMBER_STATUSES
+            self._store(user_id, is_member)
+            return is_member
+        finally:
+            self._inflight.pop(user_id, None)
+
+    async def is_member(self, user_id: int) -> bool:
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+        future = self._inflight.get(user_id)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(user_id))
+            self._inflight[user_id] = future
+        return await asyncio.shield(future)
+
+
+channel_membership = ChannelMembershipCache(bot, CHANNEL_ID)
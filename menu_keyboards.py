@@ -0,0 +1,58 @@
+from aiogram.types import InlineKeyboardButton
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from config import CHANNEL_EXISTS, CHANNEL_URL, DONATIONS_ENABLE, SUPPORT_CHAT_URL
+from handlers.buttons import (
+    ABOUT_VPN,
+    BACK,
+    CHANNEL,
+    MAIN_MENU,
+    SUB_CHANELL,
+    SUB_CHANELL_DONE,
+    SUPPORT,
+    TRIAL_SUB,
+)
+
+from .admin.panel.keyboard import AdminPanelCallback
+
+
+# Кнопки зависят только от конфига, поэтому собираются один раз при импорте.
+# Модели aiogram изменяемы (хуки могут поменять text или callback_data), поэтому строки
+# отдаются в клавиатуры только копиями через copy_row() и build_keyboard().
+Row = tuple[InlineKeyboardButton, ...]
+
+TRIAL_ROW: Row = (InlineKeyboardButton(text=TRIAL_SUB, callback_data="create_key"),)
+PROFILE_ROW: Row = (InlineKeyboardButton(text=MAIN_MENU, callback_data="profile"),)
+ADMIN_ROW: Row = (
+    InlineKeyboardButton(text="📊 Администратор", callback_data=AdminPanelCallback(action="admin").pack()),
+)
+ABOUT_ROW: Row = (InlineKeyboardButton(text=ABOUT_VPN, callback_data="about_vpn"),)
+
+if CHANNEL_EXISTS:
+    SUPPORT_ROW: Row = (
+        InlineKeyboardButton(text=SUPPORT, url=SUPPORT_CHAT_URL),
+        InlineKeyboardButton(text=CHANNEL, url=CHANNEL_URL),
+    )
+else:
+    SUPPORT_ROW: Row = (InlineKeyboardButton(text=SUPPORT, url=SUPPORT_CHAT_URL),)
+
+ABOUT_STATIC_ROWS: tuple[Row, ...] = (SUPPORT_ROW,)
+if DONATIONS_ENABLE:
+    ABOUT_STATIC_ROWS += ((InlineKeyboardButton(text="💰 Поддержать проект", callback_data="donate"),),)
+
+BACK_ROWS: dict[str, Row] = {
+    target: (InlineKeyboardButton(text=BACK, callback_data=target),) for target in ("start", "profile")
+}
+
+SUBSCRIPTION_ROWS: tuple[Row, ...] = (
+    (InlineKeyboardButton(text=SUB_CHANELL, url=CHANNEL_URL),),
+    (InlineKeyboardButton(text=SUB_CHANELL_DONE, callback_data="check_subscription"),),
+)
+
+
+def copy_row(row: Row) -> list[InlineKeyboardButton]:
+    return [button.model_copy() for button in row]
+
+
+def build_keyboard(*rows: Row) -> InlineKeyboardBuilder:
+    return InlineKeyboardBuilder(markup=[copy_row(row) for row in rows])
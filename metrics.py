@@ -0,0 +1,241 @@
+import bisect
+import time
+
+from collections.abc import Callable, Iterable
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from pydantic import BaseModel
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from logger import logger
+
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9101
+SLOW_UPDATE_THRESHOLD = 1.0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+BYTES_BUCKETS = (128, 512, 1024, 4096, 16384, 65536)
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus с фиксированными бакетами и одной меткой."""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        # значение метки -> [счетчики по бакетам..., +Inf], сумма
+        self._series: dict[str, tuple[list[int], list[float]]] = {}
+
+    def observe(self, label_value: str, value: float):
+        series = self._series.get(label_value)
+        if series is None:
+            series = self._series[label_value] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for label_value, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{{self.label}="{label_value}"}} {total[0]}'
+            yield f'{self.name}_count{{{self.label}="{label_value}"}} {cumulative}'
+
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Время обработки апдейта хендлером", "handler", LATENCY_BUCKETS)
+HANDLER_DB_QUERIES = Histogram("bot_handler_db_queries", "Запросов к БД за апдейт", "handler", COUNT_BUCKETS)
+HANDLER_DB_SECONDS = Histogram("bot_handler_db_seconds", "Время запросов к БД за апдейт", "handler", LATENCY_BUCKETS)
+HANDLER_API_CALLS = Histogram("bot_handler_api_calls", "Вызовов Bot API за апдейт", "handler", COUNT_BUCKETS)
+HANDLER_HOOK_SECONDS = Histogram("bot_handler_hook_seconds", "Время хуков за апдейт", "handler", LATENCY_BUCKETS)
+API_SECONDS = Histogram("bot_api_seconds", "Время вызова Bot API", "method", LATENCY_BUCKETS)
+API_PAYLOAD_BYTES = Histogram("bot_api_payload_bytes", "Размер запроса к Bot API", "method", BYTES_BUCKETS)
+HOOK_SECONDS = Histogram("bot_hook_seconds", "Время выполнения хука", "hook", LATENCY_BUCKETS)
+
+HISTOGRAMS = [
+    HANDLER_SECONDS,
+    HANDLER_DB_QUERIES,
+    HANDLER_DB_SECONDS,
+    HANDLER_API_CALLS,
+    HANDLER_HOOK_SECONDS,
+    API_SECONDS,
+    API_PAYLOAD_BYTES,
+    HOOK_SECONDS,
+]
+
+# Дополнительные источники метрик (например, очереди планировщика отправок)
+_collectors: list[Callable[[], Iterable[str]]] = []
+
+
+def register_collector(collector: Callable[[], Iterable[str]]):
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines = [line for histogram in HISTOGRAMS for line in histogram.render()]
+    for collector in _collectors:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            logger.error(f"[Metrics] Ошибка сбора метрик: {e}")
+    return "\n".join(lines) + "\n"
+
+
+@dataclass(slots=True)
+class UpdateStats:
+    db_queries: int = 0
+    db_time: float = 0.0
+    api_calls: int = 0
+    api_bytes: int = 0
+    hook_time: float = 0.0
+
+
+_current: ContextVar[UpdateStats | None] = ContextVar("update_stats", default=None)
+
+
+def observe_hook(name: str, elapsed: float):
+    HOOK_SECONDS.observe(name, elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.hook_time += elapsed
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: замеряет время хендлера и собирает за апдейт число и время
+    запросов к БД, вызовы Bot API и время хуков. Апдейты дольше SLOW_UPDATE_THRESHOLD
+    пишутся в лог с разбивкой.
+    """
+
+    async def __call__(self, handler, event, data: dict[str, Any]):
+        # Middleware может стоять и на родительском, и на дочернем роутере
+        if "update_stats" in data:
+            return await handler(event, data)
+
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        stats = data["update_stats"] = UpdateStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            HANDLER_SECONDS.observe(name, elapsed)
+            HANDLER_DB_QUERIES.observe(name, stats.db_queries)
+            HANDLER_DB_SECONDS.observe(name, stats.db_time)
+            HANDLER_API_CALLS.observe(name, stats.api_calls)
+            HANDLER_HOOK_SECONDS.observe(name, stats.hook_time)
+            if elapsed > SLOW_UPDATE_THRESHOLD:
+                user = data.get("event_from_user")
+                logger.warning(
+                    f"[Metrics] Медленный апдейт {name} ({user.id if user else '-'}): {elapsed:.2f}с, "
+                    f"БД {stats.db_queries} запр./{stats.db_time:.2f}с, API {stats.api_calls} выз./{stats.api_bytes}Б, "
+                    f"хуки {stats.hook_time:.2f}с"
+                )
+
+
+def _payload_size(method: TelegramMethod) -> int:
+    """Примерный размер запроса: строковые поля и вложенные объекты (клавиатуры, медиа) в JSON."""
+    size = 0
+    for value in method.__dict__.values():
+        if isinstance(value, str):
+            size += len(value.encode())
+        elif isinstance(value, BaseModel):
+            try:
+                size += len(value.model_dump_json(exclude_none=True))
+            except ValueError:
+                # Поля со значениями по умолчанию бота (Default) не сериализуются сами по себе
+                pass
+    return size
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время и размер запросов к Bot API по методам."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = type(method).__name__
+        size = _payload_size(method)
+        API_PAYLOAD_BYTES.observe(name, size)
+        stats = _current.get()
+        if stats is not None:
+            stats.api_calls += 1
+            stats.api_bytes += size
+
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            API_SECONDS.observe(name, time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_stack = conn.info.get("metrics_query_started")
+    if not started_stack:
+        return
+    elapsed = time.perf_counter() - started_stack.pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_time += elapsed
+
+
+_installed_bots: set[int] = set()
+_sqlalchemy_installed = False
+
+
+def install_metrics(bot: Bot):
+    """Подключает сбор метрик Bot API к сессии бота и SQLAlchemy-события ко всем движкам."""
+    global _sqlalchemy_installed
+    if id(bot) not in _installed_bots:
+        bot.session.middleware(ApiMetricsMiddleware())
+        _installed_bots.add(id(bot))
+    if not _sqlalchemy_installed:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _sqlalchemy_installed = True
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Запускает HTTP-эндпоинт /metrics. Возвращает AppRunner для остановки или None при ошибке."""
+    from aiohttp import web
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        # Например, порт занят другим воркером
+        logger.error(f"[Metrics] Не удалось открыть {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    logger.info(f"[Metrics] Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,202 @@
+import asyncio
+import html
+import inspect
+import os
+import sys
+import threading
+import time
+
+from collections import Counter
+from dataclasses import dataclass, field
+
+from aiogram import F, Router
+from aiogram.types import CallbackQuery, FSInputFile, InlineKeyboardButton
+
+from logger import logger
+
+from .admin.panel.keyboard import AdminPanelCallback
+
+
+PROFILER_DURATION = 30.0
+PROFILER_MAX_DURATION = 300.0
+PROFILER_INTERVAL = 0.005
+PROFILER_LAG_INTERVAL = 0.05
+PROFILER_OUTPUT_DIR = os.path.join("logs", "profiles")
+PROFILER_TOP = 10
+
+PROFILER_BUTTON = InlineKeyboardButton(
+    text="🔬 Профилирование", callback_data=AdminPanelCallback(action="profiler").pack()
+)
+
+router = Router(name="profiler")
+
+
+@dataclass(slots=True)
+class ProfileReport:
+    path: str
+    duration: float
+    samples: int
+    lag_max: float
+    lag_avg: float
+    lag_p99: float
+    top_coroutines: list[tuple[str, int]] = field(default_factory=list)
+    top_frames: list[tuple[str, int]] = field(default_factory=list)
+
+    def format(self) -> str:
+        lines = [
+            f"<b>Профилирование: {self.duration:.0f}с, {self.samples} сэмплов</b>",
+            f"Задержка event loop: макс {self.lag_max * 1000:.1f} мс, "
+            f"ср {self.lag_avg * 1000:.1f} мс, p99 {self.lag_p99 * 1000:.1f} мс",
+            "",
+            "<b>Корутины, занимавшие event loop:</b>",
+        ]
+        # В именах бывают <locals>, <genexpr>, <lambda>, которые ломают HTML-разметку сообщения
+        lines += [f"{count} — <code>{html.escape(name)}</code>" for name, count in self.top_coroutines] or ["—"]
+        lines += ["", "<b>Самые частые функции:</b>"]
+        lines += [f"{count} — <code>{html.escape(name)}</code>" for name, count in self.top_frames] or ["—"]
+        return "\n".join(lines)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # Строка начала функции, а не текущая: так стеки одной функции не дробятся на flamegraph
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _write_collapsed(path: str, stacks: Counter):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профайлер для работающего процесса. Отдельный поток раз в interval
+    снимает стеки всех потоков через sys._current_frames() и копит их в формате
+    collapsed stacks (flamegraph.pl, speedscope). Для потока event loop сэмплы также
+    относятся к внешней корутине стека — так видно, какие задачи держат цикл.
+    Параллельно корутина в самом цикле замеряет задержку event loop.
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL, lag_interval: float = PROFILER_LAG_INTERVAL):
+        self.interval = interval
+        self.lag_interval = lag_interval
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def _sample(self, loop_thread_id: int, stacks: Counter, coroutines: Counter, frames: Counter, stop: threading.Event):
+        own_id = threading.get_ident()
+        while not stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                outer_coroutine = None
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    if frame.f_code.co_flags & inspect.CO_COROUTINE:
+                        outer_coroutine = frame.f_code
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                thread_name = "event_loop" if thread_id == loop_thread_id else names.get(thread_id, str(thread_id))
+                stacks[";".join([thread_name, *reversed(stack)])] += 1
+                if thread_id == loop_thread_id:
+                    frames[stack[0]] += 1
+                    if outer_coroutine is not None:
+                        coroutines[getattr(outer_coroutine, "co_qualname", outer_coroutine.co_name)] += 1
+
+    async def _measure_lag(self, lags: list[float], stop: asyncio.Event):
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lags.append(max(loop.time() - expected, 0.0))
+
+    async def run(self, duration: float = PROFILER_DURATION, output_dir: str = PROFILER_OUTPUT_DIR) -> ProfileReport:
+        if self._running:
+            raise RuntimeError("Профилирование уже запущено")
+        self._running = True
+        duration = min(duration, PROFILER_MAX_DURATION)
+        stacks: Counter = Counter()
+        coroutines: Counter = Counter()
+        frames: Counter = Counter()
+        lags: list[float] = []
+        stop_thread = threading.Event()
+        stop_lag = asyncio.Event()
+        thread = threading.Thread(
+            target=self._sample,
+            args=(threading.get_ident(), stacks, coroutines, frames, stop_thread),
+            name="sampling_profiler",
+            daemon=True,
+        )
+        lag_task = asyncio.create_task(self._measure_lag(lags, stop_lag))
+        started = time.monotonic()
+        thread.start()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            stop_thread.set()
+            stop_lag.set()
+            await asyncio.to_thread(thread.join)
+            await lag_task
+            self._running = False
+
+        path = os.path.join(output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+        await asyncio.to_thread(_write_collapsed, path, stacks)
+
+        lags.sort()
+        return ProfileReport(
+            path=path,
+            duration=time.monotonic() - started,
+            samples=sum(stacks.values()),
+            lag_max=lags[-1] if lags else 0.0,
+            lag_avg=sum(lags) / len(lags) if lags else 0.0,
+            lag_p99=lags[min(int(len(lags) * 0.99), len(lags) - 1)] if lags else 0.0,
+            top_coroutines=coroutines.most_common(PROFILER_TOP),
+            top_frames=frames.most_common(PROFILER_TOP),
+        )
+
+
+profiler = SamplingProfiler()
+_report_tasks: set[asyncio.Task] = set()
+
+
+async def _profile_and_report(callback: CallbackQuery, duration: float):
+    # Задача фоновая: исключение здесь никто не увидит, поэтому все ошибки пишутся в лог
+    try:
+        report = await profiler.run(duration)
+    except Exception as e:
+        logger.error(f"[Profiler] Ошибка профилирования: {e}")
+        try:
+            await callback.message.answer(f"❌ Ошибка профилирования: {html.escape(str(e))}")
+        except Exception as send_error:
+            logger.error(f"[Profiler] Не удалось отправить сообщение об ошибке: {send_error}")
+        return
+    logger.info(f"[Profiler] Профиль сохранен в {report.path}")
+    try:
+        await callback.message.answer_document(FSInputFile(report.path))
+        await callback.message.answer(report.format())
+    except Exception as e:
+        logger.error(f"[Profiler] Не удалось отправить отчет ({report.path}): {e}")
+
+
+@router.callback_query(AdminPanelCallback.filter(F.action == "profiler"))
+async def handle_profiler(callback: CallbackQuery, admin: bool):
+    if not admin:
+        await callback.answer()
+        return
+    if profiler.running:
+        await callback.answer("Профилирование уже идет", show_alert=True)
+        return
+
+    await callback.answer(f"Профилирование запущено на {PROFILER_DURATION:.0f}с")
+    # Отчет придет отдельным сообщением, обработчик не держит апдейт все это время
+    task = asyncio.create_task(_profile_and_report(callback, PROFILER_DURATION), name="sampling_profiler_report")
+    _report_tasks.add(task)
+    task.add_done_callback(_report_tasks.discard)
@@ -0,0 +1,250 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from logger import logger
+
+
+SEND_GLOBAL_RATE = 30.0
+SEND_CHAT_RATE = 1.0
+SEND_CHAT_BURST = 3
+SEND_MAX_RETRIES = 3
+SEND_CHAT_BUCKETS = 100_000
+
+# Меньшее значение обслуживается раньше
+LANE_INTERACTIVE = 0
+LANE_BULK = 1
+LANE_NAMES = {LANE_INTERACTIVE: "interactive", LANE_BULK: "bulk"}
+
+# Ограничиваются только исходящие сообщения; ответы на callback, getChatMember и т.п. идут без очереди
+THROTTLED_PREFIXES = ("Send", "Edit", "Copy", "Forward")
+
+_lane: ContextVar[int] = ContextVar("send_lane", default=LANE_INTERACTIVE)
+
+
+@contextmanager
+def bulk_sends() -> Iterator[None]:
+    """Отправки внутри блока (и в задачах, созданных из него) идут в фоновую очередь рассылок."""
+    token = _lane.set(LANE_BULK)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Сколько ждать до появления целого токена."""
+        self._refill(time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def reserve(self) -> float:
+        """Забирает токен в долг и возвращает, сколько нужно подождать до своей очереди."""
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 1.0) - seconds * self.rate
+
+    @property
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+@dataclass(slots=True)
+class LaneStats:
+    waiting: int = 0
+    sent: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    retry_after: int = 0
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """
+    Планировщик исходящих запросов к Bot API, подключается как middleware сессии бота.
+
+    Общий лимит (global_rate в секунду) раздается из очереди с приоритетами: интерактивные
+    ответы всегда обслуживаются раньше рассылок (см. bulk_sends). Для каждого чата действует
+    свой лимит chat_rate с запасом chat_burst. При 429 запрос повторяется после retry_after,
+    а чат (или весь бот, если чата нет) приостанавливается на это время.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = SEND_GLOBAL_RATE,
+        chat_rate: float = SEND_CHAT_RATE,
+        chat_burst: int = SEND_CHAT_BURST,
+        max_retries: int = SEND_MAX_RETRIES,
+        max_chats: int = SEND_CHAT_BUCKETS,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: OrderedDict[int | str, TokenBucket] = OrderedDict()
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump_task: asyncio.Task | None = None
+        self._paused_until = 0.0
+        self._stats = {lane: LaneStats() for lane in LANE_NAMES}
+        self._installed: set[int] = set()
+
+    def install(self, bot: Bot):
+        if id(bot) in self._installed:
+            return
+        bot.session.middleware(self)
+        self._installed.add(id(bot))
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            # Вытесняем только простаивающие чаты: у них полный запас и их состояние не важно
+            while len(self._chats) > self.max_chats:
+                oldest_id, oldest = next(iter(self._chats.items()))
+                if not oldest.idle:
+                    break
+                del self._chats[oldest_id]
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _global_delay(self) -> float:
+        return max(self._global.delay(), self._paused_until - time.monotonic())
+
+    async def _acquire_global(self, lane: int):
+        if not self._waiters and self._global_delay() <= 0:
+            self._global.take()
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (lane, next(self._seq), future))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump(), name="send_scheduler_pump")
+        await future
+
+    async def _pump(self):
+        while self._waiters:
+            delay = self._global_delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # Ожидающий запрос отменен
+                continue
+            self._global.take()
+            future.set_result(None)
+
+    async def _acquire(self, chat_id: int | str | None, lane: int):
+        if chat_id is not None:
+            delay = self._chat_bucket(chat_id).reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await self._acquire_global(lane)
+
+    def _on_retry_after(self, method: TelegramMethod, chat_id: int | str | None, seconds: float, lane: int):
+        self._stats[lane].retry_after += 1
+        logger.warning(f"[Send] {type(method).__name__} для {chat_id}: flood control, повтор через {seconds}с")
+        if chat_id is not None:
+            self._chat_bucket(chat_id).pause(seconds)
+        else:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not type(method).__name__.startswith(THROTTLED_PREFIXES):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        lane = _lane.get()
+        stats = self._stats[lane]
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            stats.waiting += 1
+            try:
+                await self._acquire(chat_id, lane)
+            finally:
+                stats.waiting -= 1
+            waited = time.monotonic() - started
+            stats.wait_total += waited
+            stats.wait_max = max(stats.wait_max, waited)
+
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self._on_retry_after(method, chat_id, e.retry_after, lane)
+                if attempt > self.max_retries:
+                    raise
+                continue
+            stats.sent += 1
+            return response
+
+    def stats(self) -> dict[str, dict]:
+        """Глубина очередей и время ожидания по приоритетам (для метрик)."""
+        return {
+            LANE_NAMES[lane]: {
+                "waiting": stats.waiting,
+                "sent": stats.sent,
+                "wait_avg": stats.wait_total / stats.sent if stats.sent else 0.0,
+                "wait_max": stats.wait_max,
+                "retry_after": stats.retry_after,
+            }
+            for lane, stats in self._stats.items()
+        }
+
+    def metrics_lines(self) -> list[str]:
+        """Те же показатели в текстовом формате Prometheus."""
+        lines = []
+        for lane, stats in self._stats.items():
+            label = f'lane="{LANE_NAMES[lane]}"'
+            lines += [
+                f"bot_send_queue_depth{{{label}}} {stats.waiting}",
+                f"bot_send_sent_total{{{label}}} {stats.sent}",
+                f"bot_send_wait_seconds_total{{{label}}} {stats.wait_total}",
+                f"bot_send_wait_seconds_max{{{label}}} {stats.wait_max}",
+                f"bot_send_retry_after_total{{{label}}} {stats.retry_after}",
+            ]
+        return lines
+
+
+send_scheduler = SendScheduler()
@@ -1,67 +1,94 @@
+import asyncio
 import os
+import time
 
 from typing import Any
 
 from aiogram import F, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, InlineKeyboardButton, Message
+from aiogram.types import CallbackQuery, ChatMemberUpdated, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot import bot
 from config import (
     CAPTCHA_ENABLE,
-    CHANNEL_EXISTS,
-    CHANNEL_ID,
-    CHANNEL_URL,
-    DONATIONS_ENABLE,
     SHOW_START_MENU_ONCE,
-    SUPPORT_CHAT_URL,
     TRIAL_TIME_DISABLE,
 )
-from database import (
-    add_user,
-    check_user_exists,
-    get_coupon_by_code,
-    get_key_count,
-    get_trial,
-)
-from database.models import TrackingSource, User
-from handlers.buttons import (
-    ABOUT_VPN,
-    BACK,
-    CHANNEL,
-    MAIN_MENU,
-    SUB_CHANELL,
-    SUB_CHANELL_DONE,
-    SUPPORT,
-    TRIAL_SUB,
-)
-from handlers.captcha import generate_captcha
-from handlers.coupons import activate_coupon
-from handlers.payments.gift import handle_gift_link
-from handlers.profile import process_callback_view_profile
+from database import get_coupon_by_code
 from hooks.hook_buttons import insert_hook_buttons
-from handlers.texts import (
-    NOT_SUBSCRIBED_YET_MSG,
-    SUBSCRIPTION_CHECK_ERROR_MSG,
-    SUBSCRIPTION_CONFIRMED_MSG,
-    SUBSCRIPTION_REQUIRED_MSG,
-    WELCOME_TEXT,
-    get_about_vpn,
-)
-from hooks.hooks import run_hooks
+from handlers.texts import SUBSCRIPTION_REQUIRED_MSG, WELCOME_TEXT, get_about_vpn
 from logger import logger
 
 from .admin.panel.keyboard import AdminPanelCallback
-from .refferal import handle_referral_link
+from .attribution_buffer import attribution_buffer
+from .captcha_pool import (
+    CAPTCHA_BLOCK_TIME,
+    CAPTCHA_CALLBACK_PREFIX,
+    CAPTCHA_MAX_ATTEMPTS,
+    captcha_pool,
+    known_users,
+    parse_captcha_callback,
+)
+from .deep_links import CouponToken, GiftToken, ReferralToken, UtmToken, parse_start_payload
+from .expiry_notifications import NOTIFY_ENABLED, start_expiry_notifier, stop_expiry_notifier
+from .hook_dispatch import run_hooks, run_hooks_batch
+from .i18n import LocaleMiddleware, t
+from .lazy_modules import ModuleSpec, lazy, module_registry, preload
+from .locks import lease
+from .media_cache import edit_or_send_cached_photo
+from .membership import channel_membership
+from .menu_keyboards import (
+    ABOUT_ROW,
+    ABOUT_STATIC_ROWS,
+    ADMIN_ROW,
+    BACK_ROWS,
+    PROFILE_ROW,
+    SUBSCRIPTION_ROWS,
+    SUPPORT_ROW,
+    TRIAL_ROW,
+    build_keyboard,
+    copy_row,
+)
+from .metrics import HandlerMetricsMiddleware, install_metrics, register_collector, start_metrics_server
+from .send_scheduler import send_scheduler
+from .start_context import StartContext, fetch_start_context, get_start_context, invalidate_start_context
 from .utils import edit_or_send_message
+from .utm_index import utm_index
 
 
 router = Router()
-processing_gifts = set()
+router.message.middleware(LocaleMiddleware())
+router.callback_query.middleware(LocaleMiddleware())
+router.message.middleware(HandlerMetricsMiddleware())
+router.callback_query.middleware(HandlerMetricsMiddleware())
+router.include_router(module_registry.router)
+
+# Обработчики deep link'ов тянут за собой оплату, купоны и профиль: импортируются при
+# первом вызове или фоновой догрузкой после старта, а не при импорте start.py
+activate_coupon = lazy("handlers.coupons", "activate_coupon")
+handle_gift_link = lazy("handlers.payments.gift", "handle_gift_link")
+handle_referral_link = lazy("handlers.refferal", "handle_referral_link")
+process_callback_view_profile = lazy("handlers.profile", "process_callback_view_profile")
+
+# Профилирование нужно только админам: роутер подключается при первом нажатии кнопки
+module_registry.register(
+    ModuleSpec(
+        name="profiler",
+        import_path="handlers.profiler",
+        callback_prefixes=(AdminPanelCallback(action="profiler").pack(),),
+    )
+)
+
+# Все исходящие сообщения бота проходят через общий планировщик с лимитами Telegram
+send_scheduler.install(bot)
+install_metrics(bot)
+register_collector(send_scheduler.metrics_lines)
+
+_metrics_runner = None
+_preload_task = None
 
 
 @router.message(Command("start"))
@@ -70,24 +97,65 @@ async def start_entry(
     event: Message | CallbackQuery, state: FSMContext, session: Any, admin: bool, captcha: bool = True
 ):
     message = event.message if isinstance(event, CallbackQuery) else event
+    text = getattr(event, "data", None) or message.text
     if CAPTCHA_ENABLE and captcha:
-        if not await check_user_exists(session, message.chat.id):
-            captcha_data = await generate_captcha(message, state)
-            await edit_or_send_message(message, captcha_data["text"], reply_markup=captcha_data["markup"])
+        if not await known_users.contains(session, message.chat.id):
+            await send_captcha(message, state, text)
             return
-    text = getattr(event, "data", None) or message.text
     await process_start_logic(message, state, session, admin, text)
 
 
+async def send_captcha(message: Message, state: FSMContext, original_text: str | None):
+    data = await state.get_data()
+    if data.get("captcha_blocked_until", 0) > time.time():
+        await edit_or_send_message(message, t("CAPTCHA_TOO_MANY_ATTEMPTS_MSG"), reply_markup=None)
+        return
+    challenge = captcha_pool.issue()
+    await state.update_data(
+        captcha_nonce=challenge.nonce,
+        captcha_tag=challenge.answer_tag,
+        captcha_attempts=data.get("captcha_attempts", 0),
+        captcha_blocked_until=0,
+        original_text=original_text,
+    )
+    await edit_or_send_message(message, challenge.text, reply_markup=challenge.markup)
+
+
+@router.callback_query(F.data.startswith(f"{CAPTCHA_CALLBACK_PREFIX}|"))
+async def captcha_pool_callback(callback: CallbackQuery, state: FSMContext, session: Any, admin: bool):
+    parsed = parse_captcha_callback(callback.data)
+    data = await state.get_data()
+    if parsed is None or not captcha_pool.verify(data.get("captcha_nonce"), data.get("captcha_tag"), *parsed):
+        attempts = data.get("captcha_attempts", 0) + 1
+        if attempts >= CAPTCHA_MAX_ATTEMPTS:
+            # Ответ сбрасывается, чтобы старые кнопки тоже перестали работать
+            await state.update_data(
+                captcha_nonce=None,
+                captcha_tag=None,
+                captcha_attempts=0,
+                captcha_blocked_until=time.time() + CAPTCHA_BLOCK_TIME,
+            )
+            await callback.answer(t("CAPTCHA_TOO_MANY_ATTEMPTS_MSG"), show_alert=True)
+            return
+        await state.update_data(captcha_attempts=attempts)
+        await callback.answer(t("CAPTCHA_WRONG_MSG"), show_alert=True)
+        await send_captcha(callback.message, state, data.get("original_text"))
+        return
+
+    await callback.answer()
+    known_users.add(callback.from_user.id)
+    user_data = extract_user_data(callback.from_user)
+    await process_start_logic(callback.message, state, session, admin, data.get("original_text"), user_data)
+
+
 @router.callback_query(F.data == "check_subscription")
 async def check_subscription_callback(callback: CallbackQuery, state: FSMContext, session: Any, admin: bool):
     user_id = callback.from_user.id
     try:
-        member = await bot.get_chat_member(CHANNEL_ID, user_id)
-        if member.status not in ["member", "administrator", "creator"]:
+        if not await channel_membership.is_member(user_id):
             await prompt_subscription(callback)
             return
-        await callback.answer(SUBSCRIPTION_CONFIRMED_MSG)
+        await callback.answer(t("SUBSCRIPTION_CONFIRMED_MSG"))
         data = await state.get_data()
         original_text = data.get("original_text") or callback.message.text
         user_data = data.get("user_data") or extract_user_data(callback.from_user)
@@ -95,7 +163,12 @@ async def check_subscription_callback(callback: CallbackQuery, state: FSMContext
         await process_start_logic(callback.message, state, session, admin, original_text, user_data)
     except Exception as e:
         logger.error(f"[CALLBACK] Ошибка подписки: {e}", exc_info=True)
-        await callback.answer(SUBSCRIPTION_CHECK_ERROR_MSG, show_alert=True)
+        await callback.answer(t("SUBSCRIPTION_CHECK_ERROR_MSG"), show_alert=True)
+
+
+@router.chat_member(F.chat.func(channel_membership.is_channel))
+async def on_channel_member_update(event: ChatMemberUpdated):
+    channel_membership.update(event.new_chat_member.user.id, event.new_chat_member.status)
 
 
 async def process_start_logic(
@@ -115,43 +188,43 @@ async def process_start_logic(
     if text.startswith("/start "):
         text = text.split(maxsplit=1)[1]
 
+    tokens = parse_start_payload(text)
+    # Хуки start_link получают часть ссылки строкой (part), разобрать ее можно через deep_links.parse_token(part).
+    # Хук, зарегистрированный с batch=True, вызывается один раз на ссылку со всеми частями в calls
+    await run_hooks_batch(
+        "start_link",
+        [{"part": token.raw} for token in tokens],
+        message=message,
+        state=state,
+        session=session,
+        user_data=user_data,
+    )
+
+    # Обработчики ниже работают с одной AsyncSession, поэтому выполняются по очереди
     gift_detected = False
-    for part in text.split("-"):
-        await run_hooks("start_link", message=message, state=state, session=session, user_data=user_data, part=part)
-
-        if "coupons" in part:
-            await handle_coupon_link(part, message, state, session, admin, user_data)
-            continue
-        if "gift" in part:
-            gift_detected = await handle_gift(part, message, state, session, user_data)
-            break
-        if "referral" in part:
-            await handle_referral_link_safe(part, message, state, session, user_data)
-            continue
-        if "utm" in part:
-            await handle_utm_link(part, message, state, session, user_data)
+    for token in tokens:
+        if isinstance(token, CouponToken):
+            await handle_coupon_link(token.code, message, state, session, admin, user_data)
+        elif isinstance(token, GiftToken):
+            gift_detected = await handle_gift(token.gift_id, message, state, session, user_data)
+        elif isinstance(token, ReferralToken):
+            await handle_referral_link_safe(token.referrer_id, message, state, session, user_data)
+        elif isinstance(token, UtmToken):
+            await handle_utm_link(token.code, message, state, session, user_data)
 
     await state.clear()
     if gift_detected:
         return
 
-    if not await check_user_exists(session, user_data["tg_id"]):
-        await add_user(session=session, **user_data)
-
-    trial_status = await get_trial(session, user_data["tg_id"])
-    key_count = await get_key_count(session, user_data["tg_id"])
+    context = await get_start_context(session, user_data)
 
-    if SHOW_START_MENU_ONCE:
-        if key_count > 0 or trial_status != 0:
-            await process_callback_view_profile(message, state, admin, session)
-        else:
-            await show_start_menu(message, admin, session)
+    if SHOW_START_MENU_ONCE and (context.key_count > 0 or context.trial != 0):
+        await process_callback_view_profile(message, state, admin, session)
     else:
-        await show_start_menu(message, admin, session)
+        await show_start_menu(message, admin, session, context)
 
 
-async def handle_coupon_link(part, message, state, session, admin, user_data):
-    code = part.split("coupons")[1].strip("_")
+async def handle_coupon_link(code, message, state, session, admin, user_data):
     coupon = await get_coupon_by_code(session, code)
     if coupon:
         await activate_coupon(message, state, session, code, admin=admin, user_data=user_data)
@@ -159,40 +232,37 @@ async def handle_coupon_link(part, message, state, session, admin, user_data):
             return
 
 
-async def handle_gift(part, message, state, session, user_data):
-    gift_id = part.split("gift")[1].strip("_")
+async def handle_gift(gift_id, message, state, session, user_data):
     if not gift_id:
         await message.answer("❌ Неверный формат ссылки на подарок.")
         await process_callback_view_profile(message, state, False, session)
         return False
 
-    if gift_id in processing_gifts:
-        await message.answer("⏳ Подарок уже обрабатывается, подождите...")
-        await process_callback_view_profile(message, state, False, session)
-        return False
+    async with lease(f"gift:{gift_id}") as acquired:
+        if not acquired:
+            await message.answer("⏳ Подарок уже обрабатывается, подождите...")
+            await process_callback_view_profile(message, state, False, session)
+            return False
 
-    processing_gifts.add(gift_id)
-    try:
-        await handle_gift_link(gift_id, message, state, session, user_data=user_data)
-        return True
-    finally:
-        processing_gifts.discard(gift_id)
+        try:
+            await handle_gift_link(gift_id, message, state, session, user_data=user_data)
+            return True
+        finally:
+            await invalidate_start_context(user_data["tg_id"])
 
 
-async def handle_referral_link_safe(part, message, state, session, user_data):
+async def handle_referral_link_safe(referrer_id, message, state, session, user_data):
+    if referrer_id is None:
+        return
     try:
-        referrer_id = int(part.split("referral")[1].strip("_"))
         await handle_referral_link(referrer_id, message, state, session, user_data)
     except Exception:
         pass
 
 
 async def prompt_subscription(callback: CallbackQuery):
-    await callback.answer(NOT_SUBSCRIBED_YET_MSG, show_alert=True)
-    kb = InlineKeyboardBuilder()
-    kb.row(InlineKeyboardButton(text=SUB_CHANELL, url=CHANNEL_URL))
-    kb.row(InlineKeyboardButton(text=SUB_CHANELL_DONE, callback_data="check_subscription"))
-    await callback.message.edit_text(SUBSCRIPTION_REQUIRED_MSG, reply_markup=kb.as_markup())
+    await callback.answer(t("NOT_SUBSCRIBED_YET_MSG"), show_alert=True)
+    await callback.message.edit_text(SUBSCRIPTION_REQUIRED_MSG, reply_markup=build_keyboard(*SUBSCRIPTION_ROWS).as_markup())
 
 
 def extract_user_data(user) -> dict:
@@ -207,43 +277,31 @@ def extract_user_data(user) -> dict:
 
 
 async def handle_utm_link(utm_code: str, message: Message, state: FSMContext, session: AsyncSession, user_data: dict):
-    user_id = user_data["tg_id"]
-    result = await session.execute(select(TrackingSource).where(TrackingSource.code == utm_code))
-    if not result.scalar_one_or_none():
+    if not await utm_index.exists(session, utm_code):
         await message.answer("❌ UTM ссылка не найдена.")
         return
 
-    user = (await session.execute(select(User).where(User.tg_id == user_id))).scalar_one_or_none()
-    if user and not user.source_code:
-        user.source_code = utm_code
-        await session.commit()
-    elif not user:
-        await add_user(session=session, source_code=utm_code, **user_data)
+    attribution_buffer.add(user_data, utm_code)
 
 
-async def show_start_menu(message: Message, admin: bool, session: AsyncSession):
+async def show_start_menu(message: Message, admin: bool, session: AsyncSession, context: StartContext | None = None):
     image_path = os.path.join("img", "pic.jpg")
-    kb = InlineKeyboardBuilder()
 
-    trial_status = await get_trial(session, message.chat.id) if session else None
+    if context is None and session:
+        context = await fetch_start_context(session, message.chat.id)
+    trial_status = context.trial if context else None
     show_trial = trial_status == 0 and not TRIAL_TIME_DISABLE
     show_profile = not SHOW_START_MENU_ONCE or trial_status != 0 or TRIAL_TIME_DISABLE
 
+    rows = []
     if show_trial:
-        kb.row(InlineKeyboardButton(text=TRIAL_SUB, callback_data="create_key"))
+        rows.append(TRIAL_ROW)
     if show_profile:
-        kb.row(InlineKeyboardButton(text=MAIN_MENU, callback_data="profile"))
-
-    if CHANNEL_EXISTS:
-        kb.row(
-            InlineKeyboardButton(text=SUPPORT, url=SUPPORT_CHAT_URL),
-            InlineKeyboardButton(text=CHANNEL, url=CHANNEL_URL),
-        )
-    else:
-        kb.row(InlineKeyboardButton(text=SUPPORT, url=SUPPORT_CHAT_URL))
-
+        rows.append(PROFILE_ROW)
+    rows.append(SUPPORT_ROW)
     if admin:
-        kb.row(InlineKeyboardButton(text="📊 Администратор", callback_data=AdminPanelCallback(action="admin").pack()))
+        rows.append(ADMIN_ROW)
+    kb = build_keyboard(*rows)
 
     try:
         module_buttons = await run_hooks("start_menu", chat_id=message.chat.id, session=session)
@@ -251,15 +309,15 @@ async def show_start_menu(message: Message, admin: bool, session: AsyncSession):
     except Exception as e:
         logger.error(f"[Hooks:start_menu] Ошибка вставки кнопок: {e}")
 
-    kb.row(InlineKeyboardButton(text=ABOUT_VPN, callback_data="about_vpn"))
+    kb.row(*copy_row(ABOUT_ROW))
 
-    await edit_or_send_message(message, WELCOME_TEXT, reply_markup=kb.as_markup(), media_path=image_path)
+    await edit_or_send_cached_photo(message, WELCOME_TEXT, image_path, reply_markup=kb.as_markup())
 
 
 @router.callback_query(F.data == "about_vpn")
 async def handle_about_vpn(callback: CallbackQuery, session: AsyncSession):
     user_id = callback.from_user.id
-    trial = await get_trial(session, user_id)
+    trial = (await fetch_start_context(session, user_id)).trial
     back_target = "profile" if SHOW_START_MENU_ONCE and trial > 0 else "start"
 
     kb = InlineKeyboardBuilder()
@@ -270,19 +328,57 @@ async def handle_about_vpn(callback: CallbackQuery, session: AsyncSession):
     except Exception as e:
         logger.error(f"[Hooks:about_vpn] Ошибка вставки кнопок: {e}")
 
-    if CHANNEL_EXISTS:
-        about_buttons = []
-        about_buttons.append(InlineKeyboardButton(text=SUPPORT, url=SUPPORT_CHAT_URL))
-        about_buttons.append(InlineKeyboardButton(text=CHANNEL, url=CHANNEL_URL))
-        kb.row(*about_buttons)
-    else:
-        kb.row(InlineKeyboardButton(text=SUPPORT, url=SUPPORT_CHAT_URL))
+    for row in ABOUT_STATIC_ROWS:
+        kb.row(*copy_row(row))
+    kb.row(*copy_row(BACK_ROWS[back_target]))
+    text = get_about_vpn("3.2.3-minor")
+    await edit_or_send_cached_photo(callback.message, text, os.path.join("img", "pic.jpg"), reply_markup=kb.as_markup())
 
-    if DONATIONS_ENABLE:
-        kb.row(InlineKeyboardButton(text="💰 Поддержать проект", callback_data="donate"))
 
-    kb.row(InlineKeyboardButton(text=BACK, callback_data=back_target))
-    text = get_about_vpn("3.2.3-minor")
-    await edit_or_send_message(
-        callback.message, text, reply_markup=kb.as_markup(), media_path=os.path.join("img", "pic.jpg"), force_text=False
-    )
+@router.startup()
+async def replay_attribution_dead_letter():
+    await attribution_buffer.replay_dead_letter()
+
+
+@router.shutdown()
+async def flush_attribution_buffer():
+    await attribution_buffer.close()
+
+
+@router.startup()
+async def run_metrics_server():
+    global _metrics_runner
+    _metrics_runner = await start_metrics_server()
+
+
+@router.startup()
+async def preload_lazy_modules():
+    global _preload_task
+    _preload_task = asyncio.create_task(preload(), name="lazy_modules_preload")
+
+
+@router.shutdown()
+async def stop_lazy_preload():
+    if _preload_task is not None and not _preload_task.done():
+        _preload_task.cancel()
+        try:
+            await _preload_task
+        except asyncio.CancelledError:
+            pass
+
+
+@router.shutdown()
+async def stop_metrics_server():
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+
+
+@router.startup()
+async def run_expiry_notifier():
+    if NOTIFY_ENABLED:
+        start_expiry_notifier(bot)
+
+
+@router.shutdown()
+async def shutdown_expiry_notifier():
+    await stop_expiry_notifier()
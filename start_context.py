@@ -0,0 +1,143 @@
+import json
+import time
+
+from collections import OrderedDict
+from dataclasses import astuple, dataclass
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import add_user
+from database.models import Key, User
+from logger import logger
+
+
+START_CONTEXT_TTL = 60
+START_CONTEXT_CACHE_SIZE = 10_000
+
+
+@dataclass(frozen=True, slots=True)
+class StartContext:
+    exists: bool
+    trial: int
+    key_count: int
+    source_code: str | None = None
+
+
+def _cacheable(context: StartContext) -> bool:
+    # Пробный период и ключи создаются обработчиками вне этого модуля, которые кэш не
+    # сбрасывают. Поэтому кэшируется только контекст с уже использованным пробным периодом:
+    # он не меняется без invalidate_start_context и однозначно ведет /start в профиль.
+    return context.trial != 0
+
+
+class MemoryStartContextCache:
+    """LRU-кэш контекста /start в памяти процесса с ограничением по размеру и TTL."""
+
+    def __init__(self, maxsize: int = START_CONTEXT_CACHE_SIZE, ttl: float = START_CONTEXT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple[float, StartContext]] = OrderedDict()
+
+    async def get(self, tg_id: int) -> StartContext | None:
+        entry = self._entries.get(tg_id)
+        if entry is None:
+            return None
+        expires_at, context = entry
+        if expires_at < time.monotonic():
+            del self._entries[tg_id]
+            return None
+        self._entries.move_to_end(tg_id)
+        return context
+
+    async def set(self, tg_id: int, context: StartContext):
+        self._entries[tg_id] = (time.monotonic() + self.ttl, context)
+        self._entries.move_to_end(tg_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def delete(self, tg_id: int):
+        self._entries.pop(tg_id, None)
+
+
+class RedisStartContextCache:
+    """Общий для нескольких процессов кэш поверх Redis-совместимого клиента (redis.asyncio)."""
+
+    def __init__(self, redis, ttl: float = START_CONTEXT_TTL, prefix: str = "start_ctx:"):
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, tg_id: int) -> StartContext | None:
+        raw = await self.redis.get(f"{self.prefix}{tg_id}")
+        if raw is None:
+            return None
+        return StartContext(*json.loads(raw))
+
+    async def set(self, tg_id: int, context: StartContext):
+        await self.redis.set(f"{self.prefix}{tg_id}", json.dumps(astuple(context)), ex=int(self.ttl))
+
+    async def delete(self, tg_id: int):
+        await self.redis.delete(f"{self.prefix}{tg_id}")
+
+
+_cache: MemoryStartContextCache | RedisStartContextCache = MemoryStartContextCache()
+
+
+def set_start_context_cache(cache: MemoryStartContextCache | RedisStartContextCache):
+    global _cache
+    _cache = cache
+
+
+async def _cache_get(tg_id: int) -> StartContext | None:
+    try:
+        return await _cache.get(tg_id)
+    except Exception as e:
+        logger.error(f"[StartContext] Ошибка чтения кэша для {tg_id}: {e}")
+        return None
+
+
+async def _cache_set(tg_id: int, context: StartContext):
+    if not _cacheable(context):
+        return
+    try:
+        await _cache.set(tg_id, context)
+    except Exception as e:
+        logger.error(f"[StartContext] Ошибка записи кэша для {tg_id}: {e}")
+
+
+async def invalidate_start_context(tg_id: int):
+    """
+    Сбрасывает кэш контекста пользователя. Вызывать после подарка и после изменения
+    пробного периода администратором.
+    """
+    try:
+        await _cache.delete(tg_id)
+    except Exception as e:
+        logger.error(f"[StartContext] Ошибка инвалидации кэша для {tg_id}: {e}")
+
+
+async def fetch_start_context(session: AsyncSession, tg_id: int) -> StartContext:
+    context = await _cache_get(tg_id)
+    if context is not None:
+        return context
+
+    key_count = select(func.count(Key.client_id)).where(Key.tg_id == User.tg_id).scalar_subquery()
+    row = (
+        await session.execute(select(User.trial, User.source_code, key_count).where(User.tg_id == tg_id))
+    ).one_or_none()
+    if row is None:
+        return StartContext(exists=False, trial=0, key_count=0)
+
+    context = StartContext(exists=True, trial=row.trial or 0, key_count=row[2] or 0, source_code=row.source_code)
+    await _cache_set(tg_id, context)
+    return context
+
+
+async def get_start_context(session: AsyncSession, user_data: dict) -> StartContext:
+    context = await fetch_start_context(session, user_data["tg_id"])
+    if context.exists:
+        return context
+
+    await add_user(session=session, **user_data)
+    return StartContext(exists=True, trial=0, key_count=0, source_code=user_data.get("source_code"))
@@ -0,0 +1,24 @@
+"""
+Репозиторий — каталог handlers бота: код импортируется как handlers.*, а модули бота
+(config, database, logger, hooks) лежат уровнем выше. Тесты запускаются из корня
+репозитория: python -m pytest tests. Тесты, которым нужны модули бота, пропускаются,
+если рядом нет его checkout'а.
+"""
+
+import sys
+import types
+
+from pathlib import Path
+
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent
+BOT_DIR = PACKAGE_DIR.parent
+
+if str(BOT_DIR) not in sys.path:
+    sys.path.insert(0, str(BOT_DIR))
+
+if "handlers" not in sys.modules and PACKAGE_DIR.name != "handlers":
+    # Клон под другим именем каталога: регистрируем его как пакет handlers
+    package = types.ModuleType("handlers")
+    package.__path__ = [str(PACKAGE_DIR)]
+    sys.modules["handlers"] = package
@@ -0,0 +1,64 @@
+import asyncio
+import contextlib
+import json
+
+import pytest
+
+pytest.importorskip("logger")
+pytest.importorskip("database")
+
+from handlers.attribution_buffer import AttributionBuffer
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def unavailable_database():
+    raise ConnectionError("database is down")
+
+
+def user(tg_id: int) -> dict:
+    return {"tg_id": tg_id, "username": f"user{tg_id}", "first_name": None, "last_name": None, "language_code": "ru"}
+
+
+def test_failed_batch_goes_to_dead_letter(tmp_path):
+    dead_letter = tmp_path / "dead_letter.jsonl"
+    buffer = AttributionBuffer(dead_letter_file=str(dead_letter), session_factory=unavailable_database)
+
+    async def scenario():
+        buffer.add(user(1), "utm_a")
+        buffer.add(user(1), "utm_b")
+        buffer.add(user(2), "utm_b")
+        await buffer.close()
+
+    run(scenario())
+
+    rows = [json.loads(line)["row"] for line in dead_letter.read_text(encoding="utf-8").splitlines()]
+    assert [(row["tg_id"], row["source_code"]) for row in rows] == [(1, "utm_a"), (2, "utm_b")]
+
+
+def test_replay_skips_corrupted_lines(tmp_path):
+    dead_letter = tmp_path / "dead_letter.jsonl"
+    dead_letter.write_text(
+        "\n".join([
+            json.dumps({"failed_at": 1, "row": {**user(1), "source_code": "utm_a"}}),
+            '{"failed_at": 1, "row": {"tg_id": 2, "sour',
+            json.dumps({"failed_at": 1, "row": user(3)}),
+            "",
+            json.dumps({"failed_at": 1, "row": {**user(4), "source_code": "utm_b"}}),
+        ]),
+        encoding="utf-8",
+    )
+    buffer = AttributionBuffer(dead_letter_file=str(dead_letter), session_factory=unavailable_database)
+
+    async def scenario():
+        replayed = await buffer.replay_dead_letter()
+        buffer._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await buffer._task
+        return replayed
+
+    assert run(scenario()) == 2
+    assert {tg_id: row["source_code"] for tg_id, row in buffer._pending.items()} == {1: "utm_a", 4: "utm_b"}
+    assert not dead_letter.exists()
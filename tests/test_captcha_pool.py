@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("logger")
+pytest.importorskip("config")
+pytest.importorskip("database")
+
+from handlers import captcha_pool as captcha_module
+from handlers.captcha_pool import CaptchaPool, KnownUsers, parse_captcha_callback
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FakeSession:
+    def __init__(self, ids):
+        self.ids = ids
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def stream_scalars(self, stmt):
+        async def rows():
+            for tg_id in self.ids:
+                yield tg_id
+
+        return rows()
+
+
+@pytest.fixture
+def db_lookups(monkeypatch):
+    lookups = []
+
+    async def check_user_exists(session, tg_id):
+        lookups.append(tg_id)
+        return tg_id == 3
+
+    monkeypatch.setattr(captcha_module, "check_user_exists", check_user_exists)
+    return lookups
+
+
+def test_known_users_trusts_fresh_set(db_lookups):
+    known_users = KnownUsers(session_factory=lambda: FakeSession([1, 2]))
+
+    async def scenario():
+        await known_users.refresh()
+        return [await known_users.contains(None, tg_id) for tg_id in (1, 3, 4, 4)]
+
+    assert run(scenario()) == [True, False, False, False]
+    assert db_lookups == []
+
+
+def test_known_users_checks_database_before_first_load(db_lookups):
+    known_users = KnownUsers(session_factory=lambda: FakeSession([1]))
+
+    async def scenario():
+        # Загрузка стартует в фоне и завершится только после ответа
+        return await known_users.contains(None, 3), await known_users.contains(None, 4)
+
+    assert run(scenario()) == (True, False)
+    assert db_lookups == [3, 4]
+
+
+def test_known_users_checks_database_when_set_is_stale(db_lookups):
+    known_users = KnownUsers(refresh_interval=0.0, session_factory=lambda: FakeSession([1]))
+
+    async def scenario():
+        await known_users.refresh()
+        return await known_users.contains(None, 1), await known_users.contains(None, 3)
+
+    assert run(scenario()) == (True, True)
+    assert db_lookups == [3]
+
+
+def test_captcha_answer_is_bound_to_issue():
+    pool = CaptchaPool(size=4)
+    first, second = pool.issue(), pool.issue()
+    tags = [parse_captcha_callback(button.callback_data) for button in first.markup.inline_keyboard[0]]
+
+    assert first.nonce != second.nonce
+    assert sum(pool.verify(first.nonce, first.answer_tag, nonce, tag) for nonce, tag in tags) == 1
+    # Верная метка одной выдачи не подходит к другой
+    assert not pool.verify(second.nonce, second.answer_tag, first.nonce, first.answer_tag)
+    assert not pool.verify(second.nonce, second.answer_tag, second.nonce, first.answer_tag)
+
+
+def test_captcha_verify_requires_issued_challenge():
+    assert not CaptchaPool.verify(None, None, "", "")
+    assert not CaptchaPool.verify("nonce", None, "nonce", "tag")
+
+
+@pytest.mark.parametrize("data", ["captcha_pool|n", "captcha_pool|n|t|x", "other|n|t", "captcha_pool"])
+def test_malformed_captcha_callback(data):
+    assert parse_captcha_callback(data) is None
@@ -0,0 +1,65 @@
+import pytest
+
+from handlers.deep_links import (
+    CouponToken,
+    GiftToken,
+    HookToken,
+    ReferralToken,
+    UnknownToken,
+    UtmToken,
+    parse_start_payload,
+    parse_token,
+    register_link_prefix,
+)
+
+
+@pytest.mark.parametrize(
+    ("part", "token"),
+    [
+        ("coupons_SALE10", CouponToken("coupons_SALE10", "SALE10")),
+        ("couponsSALE10", CouponToken("couponsSALE10", "SALE10")),
+        ("gift_abc_", GiftToken("gift_abc_", "abc")),
+        ("referral_12345", ReferralToken("referral_12345", 12345)),
+        ("referral_12a", ReferralToken("referral_12a", None)),
+        ("referral_١٢", ReferralToken("referral_١٢", None)),
+        ("referral_", ReferralToken("referral_", None)),
+        ("utm_tiktok_spring", UtmToken("utm_tiktok_spring", "utm_tiktok_spring")),
+        ("promo", UnknownToken("promo")),
+        ("", UnknownToken("")),
+    ],
+)
+def test_parse_token(part, token):
+    assert parse_token(part) == token
+
+
+def test_payload_is_split_on_dashes():
+    assert parse_start_payload("referral_1-utm_ads-coupons_X") == (
+        ReferralToken("referral_1", 1),
+        UtmToken("utm_ads", "utm_ads"),
+        CouponToken("coupons_X", "X"),
+    )
+
+
+def test_parts_after_gift_are_ignored():
+    assert parse_start_payload("utm_ads-gift_g1-coupons_X-referral_2") == (
+        UtmToken("utm_ads", "utm_ads"),
+        GiftToken("gift_g1", "g1"),
+    )
+
+
+def test_registered_prefix_becomes_hook_token():
+    register_link_prefix("partner")
+    register_link_prefix("partnership")
+
+    assert parse_token("partner_42") == HookToken("partner_42", "partner", "42")
+    # Длинный префикс не разбирается как короткий с остатком
+    assert parse_token("partnership_7") == HookToken("partnership_7", "partnership", "7")
+    # Встроенные префиксы нельзя перехватить
+    register_link_prefix("gift")
+    assert parse_token("gift_1") == GiftToken("gift_1", "1")
+
+
+@pytest.mark.parametrize("prefix", ["", "bad-prefix"])
+def test_invalid_prefix_is_rejected(prefix):
+    with pytest.raises(ValueError):
+        register_link_prefix(prefix)
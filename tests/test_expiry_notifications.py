@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+from collections import namedtuple
+
+import pytest
+
+pytest.importorskip("logger")
+pytest.importorskip("config")
+pytest.importorskip("database")
+pytest.importorskip("handlers.admin.panel.keyboard")
+
+from handlers.expiry_notifications import KIND_10H, KIND_24H, KIND_EXPIRED, ExpiryNotifier
+
+
+Row = namedtuple("Row", "client_id tg_id email expiry_time")
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent: list[int] = []
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.sent.append(chat_id)
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def commit(self):
+        pass
+
+
+class FakeNotifier(ExpiryNotifier):
+    """Ключи хранятся в памяти по видам уведомлений; флаги Key — в marked."""
+
+    def __init__(self, rows: dict[str, list[Row]], **kwargs):
+        super().__init__(FakeBot(), session_factory=FakeSession, batch_size=1, **kwargs)
+        self.rows = rows
+        self.marked: dict[str, set[str]] = {}
+
+    async def _fetch(self, session, kind, low, high, cursor):
+        marked = self.marked.get(kind.name, set())
+        rows = sorted(
+            (row for row in self.rows.get(kind.name, []) if row.client_id not in marked),
+            key=lambda row: (row.expiry_time, row.client_id),
+        )
+        if cursor is not None:
+            rows = [row for row in rows if (row.expiry_time, row.client_id) > tuple(cursor)]
+        return rows[: self.batch_size]
+
+    async def _mark(self, session, kind, client_ids):
+        self.marked.setdefault(kind.name, set()).update(client_ids)
+
+
+def journal_entry(kind, client_id: str) -> str:
+    return json.dumps({"kind": kind.name, "client_id": client_id}) + "\n"
+
+
+def test_recover_then_mixed_kind_sweep_does_not_resend(tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+    journal = tmp_path / "journal"
+    # Прерванный проход: 24h-уведомление a1 и уведомление об истечении e1 доставлены,
+    # но флаг a1 не записан в БД, а курсор истекших ключей еще не сохранен
+    checkpoint.write_text(json.dumps({"expired": {"since": 0, "until": 10**15, "cursor": None, "retry": {}}}))
+    (tmp_path / "journal.24h").write_text(journal_entry(KIND_24H, "a1"))
+    (tmp_path / "journal.expired").write_text(journal_entry(KIND_EXPIRED, "e1"))
+
+    notifier = FakeNotifier(
+        {
+            KIND_24H.name: [Row("a1", 1, "a1", 1), Row("a2", 2, "a2", 2), Row("a3", 3, "a3", 3)],
+            KIND_10H.name: [Row("b1", 4, "b1", 1)],
+            KIND_EXPIRED.name: [Row("e1", 5, "e1", 1), Row("e2", 6, "e2", 2)],
+        },
+        checkpoint_file=str(checkpoint),
+        journal_file=str(journal),
+    )
+
+    assert asyncio.run(notifier.sweep_all()) is True
+
+    assert notifier.bot.sent == [2, 3, 4, 6]
+    assert notifier.marked == {KIND_24H.name: {"a1", "a2", "a3"}, KIND_10H.name: {"b1"}}
+    assert not list(tmp_path.glob("journal*"))
+
+
+def test_journal_keeps_recovered_entries_until_pass_ends(tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+    journal = tmp_path / "journal"
+    checkpoint.write_text(json.dumps({"expired": {"since": 0, "until": 10**15, "cursor": None, "retry": {}}}))
+    (tmp_path / "journal.expired").write_text(journal_entry(KIND_EXPIRED, "e3"))
+
+    notifier = FakeNotifier(
+        {KIND_EXPIRED.name: [Row("e1", 5, "e1", 1), Row("e2", 6, "e2", 2), Row("e3", 7, "e3", 3)]},
+        checkpoint_file=str(checkpoint),
+        journal_file=str(journal),
+    )
+    journal_states = []
+    truncate = notifier._truncate_journal
+
+    async def tracking_truncate(kind, keep=()):
+        await truncate(kind, keep)
+        path = tmp_path / f"journal.{kind.name}"
+        journal_states.append(path.read_text() if path.exists() else "")
+
+    notifier._truncate_journal = tracking_truncate
+
+    async def scenario():
+        await notifier.recover()
+        await notifier.sweep(KIND_EXPIRED)
+
+    asyncio.run(scenario())
+
+    assert notifier.bot.sent == [5, 6]
+    # Пока курсор не прошел e3, запись о нем переживает очистку журнала после каждой страницы
+    assert journal_states[:3] == [journal_entry(KIND_EXPIRED, "e3")] * 3
+    assert journal_states[-1] == ""
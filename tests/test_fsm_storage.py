@@ -0,0 +1,85 @@
+import asyncio
+import base64
+
+from datetime import datetime
+
+import pytest
+
+from aiogram.fsm.storage.base import StorageKey
+
+pytest.importorskip("logger")
+
+from handlers.fsm_storage import TTLMemoryStorage, create_redis_storage, dumps_data, dumps_text, loads_data, loads_text
+
+
+KEY = StorageKey(bot_id=1, chat_id=2, user_id=2)
+SMALL = {"key_name": "abc", "step": 1, "items": [1.5, None, True]}
+LARGE = {"text": "x" * 4096, "nested": {"a": list(range(100))}}
+
+
+class FakeRedis:
+    """Минимальный асинхронный Redis: как и настоящий клиент, отдает значения в байтах."""
+
+    def __init__(self):
+        self.values: dict[str, bytes] = {}
+
+    async def get(self, name):
+        return self.values.get(name)
+
+    async def set(self, name, value, ex=None):
+        self.values[name] = value.encode() if isinstance(value, str) else value
+
+    async def delete(self, *names):
+        for name in names:
+            self.values.pop(name, None)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.mark.parametrize("data", [SMALL, LARGE])
+def test_binary_round_trip(data):
+    assert loads_data(dumps_data(data)) == data
+
+
+@pytest.mark.parametrize("data", [SMALL, LARGE])
+def test_text_round_trip_survives_utf8_decode(data):
+    # RedisStorage.get_data декодирует значение как UTF-8 до вызова json_loads
+    stored = dumps_text(data).encode()
+    assert loads_text(stored.decode("utf-8")) == data
+
+
+def test_non_marshal_values_fall_back_to_pickle_in_memory():
+    data = {"created_at": datetime(2024, 1, 1, 12, 30)}
+    assert loads_data(dumps_data(data)) == data
+
+
+def test_text_codec_rejects_non_marshal_values():
+    with pytest.raises(TypeError):
+        dumps_text({"created_at": datetime(2024, 1, 1)})
+
+
+def test_text_codec_refuses_pickled_payload():
+    pickled = base64.b64encode(dumps_data({"created_at": datetime(2024, 1, 1)})).decode()
+    assert loads_text(pickled) == {}
+
+
+def test_memory_storage_round_trip():
+    storage = TTLMemoryStorage()
+    data = {**SMALL, "created_at": datetime(2024, 1, 1)}
+    run(storage.set_data(KEY, data))
+    assert run(storage.get_data(KEY)) == data
+
+
+@pytest.mark.parametrize("data", [SMALL, LARGE])
+def test_redis_storage_round_trip(data):
+    pytest.importorskip("redis")
+    storage = create_redis_storage(FakeRedis())
+
+    async def scenario():
+        await storage.set_state(KEY, "HappTVStates:waiting_for_code")
+        await storage.set_data(KEY, data)
+        return await storage.get_state(KEY), await storage.get_data(KEY)
+
+    assert run(scenario()) == ("HappTVStates:waiting_for_code", data)
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import pytest
+
+from aiogram.types import InlineKeyboardButton
+
+pytest.importorskip("logger")
+pytest.importorskip("hooks.hooks")
+
+from hooks.hooks import register_hook as register_direct_hook
+from hooks.hooks import run_hooks as run_upstream_hooks
+
+from handlers.hook_dispatch import CACHE_PER_KEY, register_hook, run_hooks, run_hooks_batch
+from handlers.metrics import HOOK_SECONDS
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_hooks_run_in_parallel_and_keep_order():
+    async def slow(value):
+        await asyncio.sleep(0.1)
+        return value
+
+    async def first(**kwargs):
+        return await slow("first")
+
+    async def second(**kwargs):
+        return await slow("second")
+
+    register_hook("test_parallel", first, concurrent=True)
+    register_hook("test_parallel", second, concurrent=True)
+
+    started = time.monotonic()
+    assert run(run_hooks("test_parallel")) == ["first", "second"]
+    assert time.monotonic() - started < 0.19
+
+
+def test_deadline_and_errors_are_isolated():
+    async def hangs(**kwargs):
+        await asyncio.sleep(10)
+
+    async def fails(**kwargs):
+        raise RuntimeError("boom")
+
+    async def works(**kwargs):
+        return "ok"
+
+    register_hook("test_isolated", hangs, concurrent=True, timeout=0.05)
+    register_hook("test_isolated", fails)
+    register_hook("test_isolated", works)
+
+    assert run(run_hooks("test_isolated")) == ["ok"]
+    assert "test_isolated" in HOOK_SECONDS._series
+
+
+def test_direct_hooks_run_once_after_dispatched_ones():
+    calls = []
+
+    async def dispatched(**kwargs):
+        calls.append("dispatched")
+        return "dispatched"
+
+    async def direct(**kwargs):
+        calls.append("direct")
+        return "direct"
+
+    register_direct_hook("test_mixed", direct)
+    register_hook("test_mixed", dispatched, concurrent=True)
+
+    assert run(run_hooks("test_mixed")) == ["dispatched", "direct"]
+    assert calls == ["dispatched", "direct"]
+
+
+def test_upstream_run_hooks_applies_deadline():
+    async def hangs(**kwargs):
+        await asyncio.sleep(10)
+
+    async def works(**kwargs):
+        return "ok"
+
+    register_hook("test_upstream", hangs, timeout=0.05)
+    register_hook("test_upstream", works)
+
+    assert run(run_upstream_hooks("test_upstream")) == ["ok"]
+
+
+def test_batch_passes_call_arguments():
+    async def echo(part, **kwargs):
+        return (part, kwargs["common"])
+
+    register_hook("test_batch", echo, concurrent=True)
+
+    calls = [{"part": "a"}, {"part": "b"}]
+    assert run(run_hooks_batch("test_batch", calls, common=1)) == [("a", 1), ("b", 1)]
+
+
+def test_batch_aware_hook_is_called_once():
+    received = []
+
+    async def whole_link(calls, **kwargs):
+        received.append([call["part"] for call in calls])
+        return kwargs["common"]
+
+    register_hook("test_batch_once", whole_link, batch=True)
+
+    calls = [{"part": "a"}, {"part": "b"}]
+    assert run(run_hooks_batch("test_batch_once", calls, common=1)) == [1]
+    assert received == [["a", "b"]]
+
+
+def test_cached_hook_returns_independent_copies():
+    calls = []
+
+    async def buttons(key_name, **kwargs):
+        calls.append(key_name)
+        return {"button": InlineKeyboardButton(text=key_name, callback_data=f"view|{key_name}")}
+
+    register_hook("test_cached", buttons, cache=CACHE_PER_KEY)
+
+    first = run(run_hooks("test_cached", key_name="k1"))
+    first[0]["button"].text = "changed"
+    second = run(run_hooks("test_cached", key_name="k1"))
+
+    assert calls == ["k1"]
+    assert second[0]["button"].text == "k1"
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("logger")
+
+from handlers.locks import MemoryLockBackend, lease, set_lock_backend
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def backend():
+    backend = MemoryLockBackend()
+    set_lock_backend(backend)
+    yield backend
+    set_lock_backend(MemoryLockBackend())
+
+
+def test_lease_contention(backend):
+    async def scenario():
+        async with lease("user:1") as first:
+            async with lease("user:1") as second:
+                return first, second
+
+    assert run(scenario()) == (True, False)
+
+
+def test_lease_released_on_exit(backend):
+    async def scenario():
+        async with lease("user:1"):
+            pass
+        async with lease("user:1") as acquired:
+            return acquired
+
+    assert run(scenario()) is True
+
+
+def test_lease_released_on_error(backend):
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            async with lease("user:1"):
+                raise RuntimeError("boom")
+        async with lease("user:1") as acquired:
+            return acquired
+
+    assert run(scenario()) is True
+
+
+def test_expired_lock_can_be_taken(backend):
+    async def scenario():
+        stale = await backend.acquire("user:1", ttl=0.01)
+        await asyncio.sleep(0.02)
+        async with lease("user:1") as acquired:
+            return stale, acquired
+
+    stale, acquired = run(scenario())
+    assert stale is not None
+    assert acquired is True
+
+
+def test_release_with_wrong_token_keeps_lock(backend):
+    async def scenario():
+        token = await backend.acquire("user:1", ttl=60)
+        await backend.release("user:1", "not-" + token)
+        still_held = await backend.acquire("user:1", ttl=60) is None
+        await backend.release("user:1", token)
+        released = await backend.acquire("user:1", ttl=60) is not None
+        return still_held, released
+
+    assert run(scenario()) == (True, True)
+
+
+def test_stale_owner_cannot_release_new_lock(backend):
+    async def scenario():
+        stale = await backend.acquire("user:1", ttl=0.01)
+        await asyncio.sleep(0.02)
+        fresh = await backend.acquire("user:1", ttl=60)
+        await backend.release("user:1", stale)
+        return fresh, await backend.acquire("user:1", ttl=60)
+
+    fresh, retaken = run(scenario())
+    assert fresh is not None
+    assert retaken is None
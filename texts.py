@@ -135,35 +135,30 @@ ANDROID_DESCRIPTION_TEMPLATE = (
 )
 
 
-# Тексты профилей
+# Тексты профилей (хвост сообщения зависит только от конфига и собирается при импорте)
+_LEGAL_LINKS = (
+    "<i><b>🔒 Ознакомьтесь с <a href='https://bib-net.ru/terms.html'>Пользовательским соглашением</a> и "
+    "<a href='https://bib-net.ru/privacy.html'>Политикой конфиденциальности</a>.</b></i>\n\n"
+)
+if CHANNEL_EXISTS:
+    _PROFILE_TAIL = f"</blockquote>\n{_LEGAL_LINKS}👉 <a href='{CHANNEL_URL}'>Наш канал</a> 👈"
+else:
+    _PROFILE_TAIL = f"</blockquote>\n\n{_LEGAL_LINKS}"
+
+
 def profile_message_send(username, tg_id, balance, key_count):
-    if CHANNEL_EXISTS:
-        profile_message = (
-            f"👤 <b>Профиль: {username}</b>\n\n"
-            f"<blockquote>"
-            f"•🆔 <b>ID:</b> <code>{tg_id}</code>\n"
-            f"•💰 <b>Баланс:</b> {balance} RUB\n"
-            f"•🔑 <b>Количество подписок:</b> {key_count}\n"
-            f"</blockquote>\n"
-	        f"<i><b>🔒 Ознакомьтесь с <a href='https://bib-net.ru/terms.html'>Пользовательским соглашением</a> и <a href='https://bib-net.ru/privacy.html'>Политикой конфиденциальности</a>.</b></i>\n\n"
-            f"👉 <a href='{CHANNEL_URL}'>Наш канал</a> 👈"
-        )
-    else:
-        profile_message = (
-            f"👤 <b>Профиль: {username}</b>\n\n"
-            f"<blockquote>"
-            f"•🆔 <b>ID:</b> <code>{tg_id}</code>\n"
-            f"•💰 <b>Баланс:</b> {balance} RUB\n"
-            f"•🔑 <b>Количество подписок:</b> {key_count}\n"
-            f"</blockquote>\n\n"
-	        f"<i><b>🔒 Ознакомьтесь с <a href='https://bib-net.ru/terms.html'>Пользовательским соглашением</a> и <a href='https://bib-net.ru/privacy.html'>Политикой конфиденциальности</a>.</b></i>\n\n"
-        )
-    return profile_message
+    return (
+        f"👤 <b>Профиль: {username}</b>\n\n"
+        f"<blockquote>"
+        f"•🆔 <b>ID:</b> <code>{tg_id}</code>\n"
+        f"•💰 <b>Баланс:</b> {balance} RUB\n"
+        f"•🔑 <b>Количество подписок:</b> {key_count}\n"
+        f"{_PROFILE_TAIL}"
+    )
 
 ADD_SUBSCRIPTION_HINT = "\n<blockquote>🔧 <i>Нажмите кнопку ➕ Добавить новую подписку, чтобы настроить подключение</i></blockquote>"
 
 # Тексты оплаты
-PAYMENT_OPTIONS = [{'text': f'{price} RUB', 'callback_data': f'amount|{price}'} for price in RENEWAL_PRICES.values()]
 PLAN_SELECTION_MSG = "📋 <b>Выберите план продления:</b>\n\n💰 <b>Баланс:</b> {balance} руб.\n\n📅 <b>Текущая дата истечения подписки:</b> {expiry_date} 🔑"
 PAYMENT_SUCCESS_MESSAGE = "Ваш баланс успешно пополнен на {amount} руб.{cashback_text} Спасибо за оплату!"
 AMOUNT_TEXT = "Выберите сумму пополнения:"
@@ -238,11 +233,12 @@ INSTRUCTIONS_TRIAL = (
 )
 
 
-def key_message_success(connection_link, tariff_name: str = "", traffic_limit: int = 0, device_limit: int = 0, subgroup_title: str = ""):
-    key_message = (
-        "✅ Подписка успешно создана: 🎉\n\n"
-        f"<code>{connection_link}</code>\n\n"
-    )
+_KEY_SUCCESS_TAIL = f"<i>Добавьте подписку в приложение — это просто:</i>\n\n{INSTRUCTIONS_TRIAL}"
+_KEY_MESSAGE_FOOTER = "\n<i>Подключите свое устройство по кнопкам ниже👇</i>"
+
+
+def _tariff_info(tariff_name, traffic_limit, device_limit, subgroup_title) -> str:
+    """Строки блока "Информация о тарифе" без обрамления, пустая строка если выводить нечего"""
     tariff_lines = []
     if subgroup_title and subgroup_title.strip():
         tariff_lines.append(f"📁 Группа: {subgroup_title}")
@@ -252,46 +248,29 @@ def key_message_success(connection_link, tariff_name: str = "", traffic_limit: i
         tariff_lines.append(f"📊 Трафик: {traffic_limit} ГБ")
     if device_limit is not None and device_limit > 0:
         tariff_lines.append(f"📱 Лимит устройств: {device_limit}")
-    if tariff_lines:
-        key_message += "📦 Информация о тарифе:" + "<blockquote>" + "\n".join(tariff_lines) + "\n</blockquote>\n"
-    key_message += "<i>Добавьте подписку в приложение — это просто:</i>\n\n"
-    key_message += f"{INSTRUCTIONS_TRIAL}"
-    return key_message
+    return "\n".join(tariff_lines)
+
+
+def key_message_success(connection_link, tariff_name: str = "", traffic_limit: int = 0, device_limit: int = 0, subgroup_title: str = ""):
+    tariff_info = _tariff_info(tariff_name, traffic_limit, device_limit, subgroup_title)
+    tariff_block = f"📦 Информация о тарифе:<blockquote>{tariff_info}\n</blockquote>\n" if tariff_info else ""
+    return f"✅ Подписка успешно создана: 🎉\n\n<code>{connection_link}</code>\n\n{tariff_block}{_KEY_SUCCESS_TAIL}"
 
 
 def key_message(key, formatted_expiry_date, days_left_message, server_name, country=None, hwid_count: int = 0, tariff_name: str = "", traffic_limit: int = 0, device_limit: int = 0, subgroup_title: str = ""):
-    response_message = (
-        f"🔑 <b>Ваша подписка:</b>\n\n"
-        f"<code>{key}</code>\n\n"
+    tariff_info = _tariff_info(tariff_name, traffic_limit, device_limit, subgroup_title)
+    tariff_block = f"📦 Информация о тарифе:<blockquote>{tariff_info}\n</blockquote>\n" if tariff_info else ""
+    devices_block = (
+        f"\n📱 <b>Подключенных устройств:</b> {hwid_count}\n\n"
+        if device_limit is not None and device_limit > 0 and hwid_count > 0
+        else ""
     )
-    tariff_lines = []
-    if subgroup_title and subgroup_title.strip():
-        tariff_lines.append(f"📁 Группа: {subgroup_title}")
-    if tariff_name:
-        tariff_lines.append(f"🕒 Тариф: {tariff_name}")
-    traffic = traffic_limit if traffic_limit is not None else 0
-    devices = device_limit if device_limit is not None else 0
-    if traffic > 0:
-        tariff_lines.append(f"📊 Трафик: {traffic} ГБ")
-    if devices > 0:
-        tariff_lines.append(f"📱 Лимит устройств: {devices}")
-    if tariff_lines:
-        response_message += "📦 Информация о тарифе:" + "<blockquote>" + "\n".join(tariff_lines) + "\n</blockquote>\n"
-
-    if device_limit is not None and device_limit > 0 and hwid_count > 0:
-        response_message += f"\n📱 <b>Подключенных устройств:</b> {hwid_count}\n\n"
-
-    response_message += (
-        f"📅 <b>Статус подписки:</b>\n"
-        f"<blockquote>{days_left_message}\n"
-        f"🛑 Истекает: {formatted_expiry_date}</blockquote>\n"
+    country_block = f"🌍 <b>Локация:</b> {country}\n" if country else ""
+    return (
+        f"🔑 <b>Ваша подписка:</b>\n\n<code>{key}</code>\n\n{tariff_block}{devices_block}"
+        f"📅 <b>Статус подписки:</b>\n<blockquote>{days_left_message}\n🛑 Истекает: {formatted_expiry_date}</blockquote>\n"
+        f"{country_block}{_KEY_MESSAGE_FOOTER}"
     )
-    
-    if country:
-        response_message += f"🌍 <b>Локация:</b> {country}\n"
-
-    response_message += "\n<i>Подключите свое устройство по кнопкам ниже👇</i>"
-    return response_message
 
 # Уведомления о подписках и ключах
 KEY_NOT_FOUND_MSG = "🔍 Подписка не найдена."
@@ -309,26 +288,11 @@ KEY_EXPIRED_NO_DELAY_MSG = (
 )
 
 def get_renewal_message(tariff_name: str = "", traffic_limit: int = 0, device_limit: int = 0, expiry_date: str = "", subgroup_title: str = "") -> str:
-    response_message = "✅ Ваша подписка была успешно продлена"
-    
-    tariff_lines = []
-    if subgroup_title and subgroup_title.strip():
-        tariff_lines.append(f"📁 Группа: {subgroup_title}")
-    if tariff_name:
-        tariff_lines.append(f"🕒 Тариф: {tariff_name}")
-    if traffic_limit is not None and traffic_limit > 0:
-        tariff_lines.append(f"📊 Трафик: {traffic_limit} ГБ")
-    if device_limit is not None and device_limit > 0:
-        tariff_lines.append(f"📱 Лимит устройств: {device_limit}")
-    
-    if tariff_lines:
-        response_message += "\n\n📦 Информация о тарифе:" + "<blockquote>" + "\n".join(tariff_lines) + "\n</blockquote>"
-    
-    if expiry_date and expiry_date.strip():
-        response_message += f"\n📅 Подписка продлена до <b>{expiry_date}</b>"
-    
-    return response_message
-    
+    tariff_info = _tariff_info(tariff_name, traffic_limit, device_limit, subgroup_title)
+    tariff_block = f"\n\n📦 Информация о тарифе:<blockquote>{tariff_info}\n</blockquote>" if tariff_info else ""
+    expiry_block = f"\n📅 Подписка продлена до <b>{expiry_date}</b>" if expiry_date and expiry_date.strip() else ""
+    return f"✅ Ваша подписка была успешно продлена{tariff_block}{expiry_block}"
+
 KEY_EXPIRY_10H = (
     "<b>Уведомление по подписке {email}:</b>\n\n"
     "<blockquote>{hours_left_formatted}\n"
@@ -520,6 +484,8 @@ COUPON_DAYS_ACTIVATED_MSG = (
 
 # Тексты капчи
 CAPTCHA_PROMPT_MSG = "🔒 Для подтверждения, что вы не робот, выберите кнопку с {correct_text}"
+CAPTCHA_WRONG_MSG = "❌ Неверный ответ, попробуйте еще раз."
+CAPTCHA_TOO_MANY_ATTEMPTS_MSG = "⏳ Слишком много неверных ответов. Попробуйте снова через несколько минут."
 
 
 # Тексты рассылок горячих лидов
@@ -577,3 +543,12 @@ TORRENT_UNBLOCKED_MSG = (
     "• Пожалуйста, воздержитесь от использования торрентов\n"
     "• Убедитесь, что торрент-клиент полностью выключен"
 )
+
+
+def __getattr__(name):
+    # PAYMENT_OPTIONS нужен только в оплате: собирается при первом обращении, а не при старте
+    if name == "PAYMENT_OPTIONS":
+        options = [{'text': f'{price} RUB', 'callback_data': f'amount|{price}'} for price in RENEWAL_PRICES.values()]
+        globals()[name] = options
+        return options
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+from collections import OrderedDict
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import TrackingSource, User
+from logger import logger
+
+
+UTM_INDEX_REFRESH_INTERVAL = 300.0
+UTM_NEGATIVE_TTL = 60.0
+UTM_NEGATIVE_CACHE_SIZE = 50_000
+
+
+class TrackingSourceIndex:
+    """
+    Множество кодов TrackingSource в памяти. Полностью перечитывается раз в
+    refresh_interval; код, которого нет в индексе, один раз проверяется в БД
+    (на случай, если источник создан после обновления), а отрицательный
+    результат кэшируется на negative_ttl.
+    """
+
+    def __init__(
+        self,
+        refresh_interval: float = UTM_INDEX_REFRESH_INTERVAL,
+        negative_ttl: float = UTM_NEGATIVE_TTL,
+        negative_cache_size: int = UTM_NEGATIVE_CACHE_SIZE,
+    ):
+        self.refresh_interval = refresh_interval
+        self.negative_ttl = negative_ttl
+        self.negative_cache_size = negative_cache_size
+        self._codes: frozenset[str] = frozenset()
+        self._refreshed_at: float | None = None
+        self._negative: OrderedDict[str, float] = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    async def refresh(self, session: AsyncSession):
+        codes = (await session.execute(select(TrackingSource.code))).scalars().all()
+        self._codes = frozenset(codes)
+        self._refreshed_at = time.monotonic()
+        self._negative.clear()
+
+    async def _ensure_fresh(self, session: AsyncSession):
+        if self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        async with self._lock:
+            if self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_interval:
+                try:
+                    await self.refresh(session)
+                except Exception as e:
+                    logger.error(f"[UTM] Не удалось обновить индекс источников: {e}")
+                    if self._refreshed_at is None:
+                        raise
+
+    async def exists(self, session: AsyncSession, code: str) -> bool:
+        await self._ensure_fresh(session)
+        if code in self._codes:
+            return True
+
+        now = time.monotonic()
+        expires_at = self._negative.get(code)
+        if expires_at is not None and expires_at > now:
+            return False
+
+        found = await session.scalar(select(TrackingSource.code).where(TrackingSource.code == code).limit(1))
+        if found is not None:
+            self.add(code)
+            return True
+
+        self._negative[code] = now + self.negative_ttl
+        self._negative.move_to_end(code)
+        while len(self._negative) > self.negative_cache_size:
+            self._negative.popitem(last=False)
+        return False
+
+    def add(self, code: str):
+        """Вызывать после создания источника, чтобы он сразу стал доступен."""
+        self._codes = self._codes | {code}
+        self._negative.pop(code, None)
+
+    def discard(self, code: str):
+        """Вызывать после удаления источника."""
+        self._codes = self._codes - {code}
+
+    def invalidate(self):
+        self._refreshed_at = None
+
+
+utm_index = TrackingSourceIndex()
+
+
+def _insert_for(session: AsyncSession):
+    dialect = session.bind.dialect.name if session.bind is not None else "postgresql"
+    return sqlite.insert if dialect == "sqlite" else postgresql.insert
+
+
+async def attribute_sources(session: AsyncSession, rows: list[dict]):
+    """
+    Создает пользователей с source_code или проставляет source_code существующим,
+    если он еще не задан, — одним (многострочным) INSERT ... ON CONFLICT DO UPDATE.
+    Каждая строка — данные пользователя как для add_user плюс source_code.
+    """
+    if not rows:
+        return
+    insert = _insert_for(session)
+    stmt = insert(User).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.tg_id],
+        set_={"source_code": func.coalesce(User.source_code, stmt.excluded.source_code)},
+    )
+    await session.execute(stmt)
+    await session.commit()
+
+
+async def attribute_source(session: AsyncSession, user_data: dict, source_code: str):
+    await attribute_sources(session, [{**user_data, "source_code": source_code}])